@@ -0,0 +1,229 @@
+# benchmarks/run.py
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+import sklearn
+from src.schema import DOMAIN_CONFIG
+from src.engine import AdvancedFraudEngine
+from src.features import calculate_haversine
+from src.ml_logic import FraudModel, SUBSAMPLE_ROWS
+from src.hybrid import HybridScorer
+from src.velocity import add_velocity
+from src.graph import add_graph
+from benchmarks.synth import synthetic_frame
+
+RESULTS_DIR = "benchmarks/results"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+DEFAULT_SIZES = ["10k", "100k"]
+# Runs per throughput case (the fastest counts): at least REPEATS, and fast
+# cases keep going until MIN_SECONDS have passed so their minimum is stable
+REPEATS = 3
+MIN_SECONDS = 0.2
+MAX_REPEATS = 200
+# Calls per latency case
+LATENCY_CALLS = 2_000
+# Stated per-call targets (ms) of latency cases, checked on every run: one row's
+# encoding on the scoring path must stay at p50 < 10 us, p99 < 50 us (the model itself
+# excluded; predict_single adds it: p50 2.5-4.5 ms end to end at 10k rows when this was set)
+LATENCY_TARGETS = {"encode_single": {"p50_ms": 0.010, "p99_ms": 0.050}}
+# Cold-start cases: each module is imported in a fresh interpreter (numpy is the floor
+# of the NumPy-only core: engine, rules, features)
+IMPORT_MODULES = ["numpy", "src.engine", "src.features", "src.ml_logic", "src.service", "src.layout"]
+# Training is capped like the app's fast mode, so large sizes stay tractable
+TRAIN_MODEL = "Hist Gradient Boosting"
+# A result regresses when it is this much worse than the baseline (0.25 = 25%)
+TOLERANCE = 0.25
+# Metrics checked for regressions (lower is better; rows_per_s just restates seconds),
+# with the absolute slack a change must also exceed, so sub-millisecond jitter isn't flagged
+SLACK = {"seconds": 0.002, "p50_ms": 0.002, "p99_ms": 0.01, "peak_mb": 1.0}
+
+
+# --- MEASUREMENT ---
+
+def throughput(func, rows, repeats=REPEATS, memory=True):
+    """Best-of-repeats wall time of func() over rows, plus its traced peak memory."""
+    best, total, runs = float('inf'), 0.0, 0
+    while runs < repeats or (total < MIN_SECONDS and runs < MAX_REPEATS):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best, total, runs = min(best, elapsed), total + elapsed, runs + 1
+    result = {"seconds": best, "rows_per_s": rows / best}
+    if memory:
+        result["peak_mb"] = peak_memory(func)
+    return result
+
+
+def latency(func, inputs):
+    """Per-call latency percentiles of func over a list of inputs."""
+    times = np.empty(len(inputs))
+    for i, item in enumerate(inputs):
+        started = time.perf_counter()
+        func(item)
+        times[i] = time.perf_counter() - started
+    p50, p99 = np.percentile(times * 1000, [50, 99])
+    return {"p50_ms": p50, "p99_ms": p99}
+
+
+def peak_memory(func):
+    """Peak Python/NumPy allocation (MB) during one traced call (tracing slows it, so it isn't timed)."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def import_time(module, repeats=REPEATS):
+    """Best-of-repeats time to import a module into a fresh interpreter (nothing cached in sys.modules)."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    best = float('inf')
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        best = min(best, float(out.stdout.split()[-1]))
+    return {"seconds": best}
+
+
+# --- CASES ---
+
+def bench_domain(domain, rows, memory=True):
+    """Every benchmark of one domain at one size. Returns {case: metrics}."""
+    config = DOMAIN_CONFIG[domain]
+    raw = synthetic_frame(domain, rows)
+    results = {}
+
+    df = add_graph(add_velocity(raw, config), config)
+    if 'velocity' in config or 'graph' in config:
+        results["features"] = throughput(lambda: add_graph(add_velocity(raw, config), config), rows, memory=memory)
+    records = df.head(LATENCY_CALLS).to_dict('records')
+
+    engine = AdvancedFraudEngine(context={})
+    results["engine.analyze_batch"] = throughput(lambda: engine.analyze_batch(df, domain), rows, memory=memory)
+    results["engine.analyze_transaction"] = latency(lambda r: engine.analyze_transaction(r, domain), records)
+
+    model = FraudModel(df, config, model_type=TRAIN_MODEL)
+    results["preprocess"] = throughput(model.preprocess, rows, memory=memory)
+
+    model = FraudModel(df, config, model_type=TRAIN_MODEL, subsample=SUBSAMPLE_ROWS)
+    started = time.perf_counter()
+    metrics = model.train()
+    if "error" in metrics:
+        return results
+    results["train"] = {"seconds": time.perf_counter() - started}
+    if metrics['fit_rss_growth_mb'] is not None:
+        # Not a regression metric: it depends on the peak the earlier cases left behind
+        results["train"]["rss_growth_mb"] = metrics['fit_rss_growth_mb']
+
+    results["predict_batch"] = throughput(lambda: model.predict_batch(df), rows, memory=memory)
+    results["encode_single"] = latency(model.encode_single, records)
+    results["predict_single"] = latency(model.predict_single, records)
+    # Rules + model in one pass; rule-blocked rows skip the model
+    scorer = HybridScorer(model, domain, engine)
+    results["hybrid.score_batch"] = throughput(lambda: scorer.score_batch(df), rows, memory=memory)
+    return results
+
+
+def bench_haversine(rows, memory=True):
+    rng = np.random.default_rng(0)
+    lat1, lat2 = rng.uniform(-80, 80, (2, rows))
+    lon1, lon2 = rng.uniform(-180, 180, (2, rows))
+    points = list(zip(lat1[:LATENCY_CALLS].tolist(), lon1[:LATENCY_CALLS].tolist(),
+                      lat2[:LATENCY_CALLS].tolist(), lon2[:LATENCY_CALLS].tolist()))
+    return {
+        "vector": throughput(lambda: calculate_haversine(lat1, lon1, lat2, lon2), rows, memory=memory),
+        "scalar": latency(lambda p: calculate_haversine(*p), points),
+    }
+
+
+def run(sizes=DEFAULT_SIZES, domains=None, memory=True, log=print):
+    """Runs the import cases, then every case at every size. Returns {"meta": ..., "results": {"<case>@<size>": metrics}}."""
+    results = {f"import.{module}": import_time(module) for module in IMPORT_MODULES}
+    for size in sizes:
+        rows = SIZES[size]
+        for name, metrics in bench_haversine(rows, memory).items():
+            results[f"calculate_haversine.{name}@{size}"] = metrics
+        for domain in domains or DOMAIN_CONFIG:
+            log(f"{domain} @ {size}")
+            for case, metrics in bench_domain(domain, rows, memory).items():
+                results[f"{domain}/{case}@{size}"] = metrics
+    return {
+        "meta": {
+            "created": time.time(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+            "machine": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": {key: {k: float(f"{v:.6g}") for k, v in m.items()} for key, m in results.items()},
+    }
+
+
+# --- REGRESSIONS ---
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """(case, metric, baseline, current) for every metric worse than the baseline by more than tolerance (and SLACK)."""
+    regressions = []
+    for key, metrics in current['results'].items():
+        base = baseline['results'].get(key, {})
+        for metric, slack in SLACK.items():
+            old, value = base.get(metric), metrics.get(metric)
+            if old is None or value is None:
+                continue
+            if value - old > max(tolerance * old, slack):
+                regressions.append((key, metric, old, value))
+    return regressions
+
+
+def missed_targets(current, targets=LATENCY_TARGETS):
+    """(case, metric, target, current) for every latency case slower than its stated target."""
+    missed = []
+    for key, metrics in current['results'].items():
+        case = key.split("@")[0].split("/")[-1]
+        for metric, target in targets.get(case, {}).items():
+            if metrics.get(metric, 0) > target:
+                missed.append((key, metric, target, metrics[metric]))
+    return missed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic data of every domain.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, choices=list(SIZES))
+    parser.add_argument("--domains", nargs="+", choices=list(DOMAIN_CONFIG))
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory runs")
+    parser.add_argument("--out", help=f"results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.domains, memory=not args.no_memory)
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{len(report['results'])} results -> {out}")
+
+    missed = missed_targets(report)
+    for key, metric, target, value in missed:
+        print(f"OVER TARGET {key} {metric}: {value:.4g} > {target:.4g}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for key, metric, old, new in regressions:
+            print(f"REGRESSION {key} {metric}: {old:.4g} -> {new:.4g}")
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%}")
+        missed += regressions
+    if missed:
+        sys.exit(1)
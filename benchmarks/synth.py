@@ -0,0 +1,92 @@
+# benchmarks/synth.py
+import numpy as np
+import pandas as pd
+from src.schema import DOMAIN_CONFIG
+from src.rules import CATEGORY_THRESHOLDS
+from src.velocity import velocity_columns
+from src.graph import GRAPH_COLUMNS
+
+FRAUD_RATE = 0.01
+# Levels of categorical columns without known values
+CATEGORY_LEVELS = 20
+# Values the rules look for, so their hit rates resemble the real data
+CATEGORY_VALUES = {
+    "category": list(CATEGORY_THRESHOLDS) + ["shopping_net", "gas_transport", "misc_net", "entertainment"],
+    "gender": ["M", "F"],
+    "type": ["PAYMENT", "TRANSFER", "CASH_OUT", "DEBIT", "CASH_IN"],
+    "NAME_CONTRACT_TYPE": ["Cash loans", "Consumer loans", "Revolving loans"],
+    "NAME_CLIENT_TYPE": ["New", "Repeater", "Refreshed"],
+}
+# Raw target values of each class (positive second)
+TARGET_LABELS = {"NAME_CONTRACT_STATUS": ("Approved", "Refused")}
+# Average transactions per card / account, and seconds between transactions
+TXNS_PER_KEY = 50
+MEAN_GAP_SECONDS = 2.0
+
+
+def _credit_card(df, rng):
+    # Merchants mostly near the cardholder, a few anywhere
+    far = rng.random(len(df)) < 0.05
+    df['merch_lat'] = np.where(far, df['merch_lat'], df['lat'] + rng.normal(0, 0.5, len(df)))
+    df['merch_long'] = np.where(far, df['merch_long'], df['long'] + rng.normal(0, 0.5, len(df)))
+    df['amt'] = np.round(rng.lognormal(4, 1.2, len(df)), 2)
+
+
+def _mobile(df, rng):
+    # Balances that mostly add up, with some drained and some inconsistent accounts
+    df['amount'] = np.round(rng.lognormal(10, 1.5, len(df)), 2)
+    df['oldbalanceOrg'] = np.round(rng.lognormal(10, 2, len(df)), 2) * (rng.random(len(df)) > 0.3)
+    balance = np.maximum(df['oldbalanceOrg'] - df['amount'], 0)
+    df['newbalanceOrig'] = np.where(rng.random(len(df)) < 0.1, balance + 5, balance)
+
+
+def _loan(df, rng):
+    df['AMT_GOODS_PRICE'] = df['AMT_CREDIT'] / rng.uniform(0.7, 1.4, len(df))
+    df['AMT_ANNUITY'] = df['AMT_CREDIT'] * rng.uniform(0.02, 0.25, len(df))
+
+
+SHAPES = {"Credit Card": _credit_card, "Mobile Transaction": _mobile, "Loan Application": _loan}
+
+
+def synthetic_frame(domain, rows, seed=0, fraud_rate=FRAUD_RATE):
+    """
+    A raw frame with every column DOMAIN_CONFIG[domain] reads: features in
+    their slider ranges, the target, ids and the raw velocity / graph columns
+    (in time order, as transaction logs are). Features computed by the
+    pipeline (velocity, graph) are left out, as in the real CSVs.
+    """
+    config = DOMAIN_CONFIG[domain]
+    features = config['features']
+    rng = np.random.default_rng(seed)
+    computed = set(velocity_columns()) | set(GRAPH_COLUMNS)
+
+    data = {}
+    for col, spec in features['numerical'].items():
+        if col not in computed:
+            data[col] = rng.uniform(spec['min'], spec['max'], rows)
+    for col in features['categorical']:
+        levels = CATEGORY_VALUES.get(col) or [f"{col}_{i}" for i in range(CATEGORY_LEVELS)]
+        data[col] = rng.choice(levels, rows)
+    for col in features['flags']:
+        data[col] = rng.choice([0.0, 1.0, np.nan], rows)
+    for col in config.get('drop_cols', []):
+        data[col] = np.arange(rows)
+
+    keys = max(rows // TXNS_PER_KEY, 1)
+    spec = config.get('velocity')
+    if spec:
+        data[spec['key']] = 4_000_000_000 + rng.integers(0, keys, rows)
+        data[spec['time']] = 1_325_376_000 + np.cumsum(rng.exponential(MEAN_GAP_SECONDS, rows)).astype(np.int64)
+    spec = config.get('graph')
+    if spec:
+        data[spec['orig']] = pd.Series(rng.integers(0, rows, rows)).map('C{}'.format).to_numpy(dtype=object)
+        data[spec['dest']] = pd.Series(rng.integers(0, keys * 10, rows)).map('C{}'.format).to_numpy(dtype=object)
+        data[spec['time']] = np.sort(rng.integers(1, 744, rows)).astype(np.float64)
+
+    negative, positive = TARGET_LABELS.get(config['target'], (0, 1))
+    data[config['target']] = np.where(rng.random(rows) < fraud_rate, positive, negative)
+
+    df = pd.DataFrame(data)
+    if domain in SHAPES:
+        SHAPES[domain](df, rng)
+    return df
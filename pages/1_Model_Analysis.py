@@ -1,9 +1,13 @@
 # pages/1_Model_Analysis.py
+import os
 import streamlit as st
 import pandas as pd
-from src.layout import load_sidebar
+from src.layout import load_sidebar, get_stored_model, get_training_cache
 from src.schema import DOMAIN_CONFIG
-from src.ml_logic import FraudModel
+from src.ml_logic import FraudModel, MODEL_BACKENDS, SUBSAMPLE_ROWS, HOLDOUT_FRACTION
+from src.model_store import find_latest, save_model, training_key
+from src.evaluation import expected_cost, optimal_threshold
+from src.hybrid import train_hybrid, CALIBRATION_FRACTION
 
 st.set_page_config(page_title="Model Analysis", layout="wide")
 load_sidebar()
@@ -14,6 +18,8 @@ if 'current_df' not in st.session_state:
 
 domain = st.session_state['domain']
 df = st.session_state['current_df']
+fingerprint = st.session_state['data_fingerprint']
+source = st.session_state.get('data_source')
 config = DOMAIN_CONFIG[domain]
 
 st.title(f"🧠 Model Training: {domain}")
@@ -23,43 +29,160 @@ col_sel1, col_sel2 = st.columns([1, 3])
 with col_sel1:
     model_choice = st.selectbox(
         "Select Architecture", 
-        ["Random Forest", "Gradient Boosting"]
+        list(MODEL_BACKENDS)
+    )
+    fast_mode = st.checkbox(
+        "Fast mode",
+        value=False,
+        help=f"Train on at most {SUBSAMPLE_ROWS:,} rows: every fraud case plus re-weighted negatives."
+    )
+    full_file = st.checkbox(
+        "Full file (out-of-core)",
+        value=False,
+        disabled=source is None,
+        help="Stream the whole file from disk instead of the loaded sample, in fixed memory: "
+             f"every fraud case plus re-weighted negatives up to {SUBSAMPLE_ROWS:,} rows, "
+             f"validated on the latest {HOLDOUT_FRACTION:.0%} of rows. Sample data only."
+    )
+    hybrid = st.checkbox(
+        "Hybrid (rules + ML)",
+        value=False,
+        disabled=full_file,
+        help="Feed the rule engine's hits to the model as features and learn how to blend the rule score "
+             f"with the model probability on the latest {CALIBRATION_FRACTION:.0%} of rows."
     )
 
 with col_sel2:
     st.info(
-        "**Random Forest**: Good for balanced robustness.\n\n"
+        "**Random Forest**: Good for balanced robustness (trains on all cores).\n\n"
+        "**Hist Gradient Boosting**: Fastest on large data; native categories and class weighting.\n\n"
         "**Gradient Boosting**: Better at finding specific, hard-to-catch fraud patterns."
     )
 
+def show_threshold(model, metrics):
+    # --- THRESHOLD ---
+    # Every cutoff was scored at training time, so moving the costs only re-reads the stored curve
+    st.subheader("Where should the alert threshold sit?")
+    curve = metrics['curve']
+    costs = metrics['costs']
+    missed_cost = st.number_input(
+        "Cost of a missed fraud (in false alarms)",
+        min_value=1.0, value=float(costs['missed_fraud'] / costs['false_alarm']), step=1.0,
+        help="The threshold minimising false alarms + this × missed frauds on the test split."
+    )
+    best = optimal_threshold(curve, 1.0, missed_cost)
+    # The model is this session's own copy (the cache and the store hand out copies),
+    # so the pick reaches the Simulation Lab without moving other sessions' cutoff
+    model.set_threshold(best['threshold'])
+    if model.blend is not None:
+        st.caption("Hybrid risk of this model is cut at the blend's own learned cutoffs; this threshold applies to the model probability alone.")
+
+    t1, t2, t3, t4 = st.columns(4)
+    t1.metric("Threshold", f"{max(best['threshold'], 0.0):.3f}")  # the alert-everything row sits just below 0
+    t2.metric("Precision", f"{best['precision']:.2%}")
+    t3.metric("Recall", f"{best['recall']:.2%}")
+    t4.metric("Alert Rate", f"{best['alert_rate']:.2%}")
+
+    g1, g2 = st.columns(2)
+    g1.caption("Precision, recall and alert rate by threshold")
+    g1.line_chart(curve.set_index('threshold')[['precision', 'recall', 'alert_rate']])
+    g2.caption("Expected cost by threshold")
+    g2.line_chart(pd.DataFrame({'cost': expected_cost(curve, 1.0, missed_cost).to_numpy()}, index=curve['threshold']))
+
+def show_results(model, metrics):
+    # --- METRICS & DEBUG ---
+    with st.expander("Debug Info", expanded=False):
+        st.write(metrics['debug'])
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Precision", f"{metrics['precision']:.2%}", help=f"At the trained threshold ({metrics['threshold']:.3f})")
+    c2.metric("Recall", f"{metrics['recall']:.2%}")
+    c3.metric("F1 Score", f"{metrics['f1']:.2%}")
+
+    c4, c5, c6 = st.columns(3)
+    c4.metric("Training Time", f"{metrics['train_seconds']:.2f} s")
+    growth = metrics.get('fit_rss_growth_mb')
+    c5.metric("Peak RSS Growth", "n/a" if growth is None else f"{growth:.0f} MB",
+              help="How far the fit pushed the process's peak resident memory (native buffers included; 0 when it stayed under an earlier peak)")
+    c6.metric("Training Rows", f"{metrics['train_rows']:,}")
+
+    if 'hybrid' in metrics:
+        h = metrics['hybrid']
+        st.subheader(f"Hybrid scoring (latest {h['rows']:,} rows, unseen by the blend)")
+        h1, h2, h3, h4 = st.columns(4)
+        h1.metric("Precision", f"{h['precision']:.2%}", help="Transactions sent to review or blocked")
+        h2.metric("Recall", f"{h['recall']:.2%}")
+        h3.metric("Alert Rate", f"{h['alert_rate']:.2%}")
+        h4.metric("Model Skipped", f"{h['model_skipped']:.2%}", help="Rows the rules blocked on their own")
+        if metrics['blend']:
+            blend = metrics['blend']
+            st.caption(
+                "Blend weights (logistic): " + ", ".join(f"{k} {blend[k]:+.2f}" for k in ("bias", "model", "rules"))
+                + f". Review above {blend['review']:.3f}, block above {blend['block']:.3f} blended probability."
+            )
+    
+    # --- FEATURE IMPORTANCE ---
+    st.subheader("What did this model learn?")
+    importance_df = pd.DataFrame(
+        list(metrics['importance'].items()), 
+        columns=['Feature', 'Importance']
+    ).sort_values(by='Importance', ascending=False).head(10)
+    
+    st.bar_chart(importance_df.set_index('Feature'))
+
+    show_threshold(model, metrics)
+
+saved_path = find_latest(domain, model_choice, fingerprint)
+stream = full_file and source is not None
+hybrid = hybrid and not stream
+settings = {"subsample": SUBSAMPLE_ROWS if fast_mode or stream else None}
+if stream:
+    settings["stream"] = True
+if hybrid:
+    settings["hybrid"] = True
+# Same data, domain config, architecture and settings -> same model (training is seeded)
+key = training_key(fingerprint, config, model_choice, **settings)
+cache = get_training_cache()
+
 if st.button(f"Train {model_choice}", type="primary"):
-    with st.spinner("Training..."):
-        
-        # Pass model_choice to the class
-        model = FraudModel(df, config, model_type=model_choice)
-        metrics = model.train()
-        
-        if "error" in metrics:
-            st.error(metrics['error'])
-            st.stop()
+    model = cache.get(key)
+    if model is None and saved_path:
+        stored = get_stored_model(saved_path)
+        if stored is not None and stored.training_key == key:
+            model = stored
+            cache.put(key, model, os.path.getsize(saved_path))
+
+    if model is not None:
+        st.success(f"{model_choice} already trained with these settings on this dataset; reused it.")
+    else:
+        with st.spinner("Training..."):
+            # Pass model_choice to the class
+            if hybrid:
+                scorer, metrics = train_hybrid(df, domain, model_choice, subsample=settings["subsample"])
+                model = scorer.model if scorer is not None else None
+            elif stream:
+                model = FraudModel(None, config, model_type=model_choice, subsample=settings["subsample"])
+                metrics = model.train_stream(source)
+            else:
+                model = FraudModel(df, config, model_type=model_choice, subsample=settings["subsample"])
+                metrics = model.train()
+
+            if "error" in metrics:
+                st.error(metrics['error'])
+                st.stop()
+
+            path = save_model(model, domain, fingerprint, key)
+            cache.put(key, model, os.path.getsize(path))
+            st.success(f"{model_choice} Training Complete!")
+
+    st.session_state['trained_model'] = model
+    show_results(model, model.metrics)
 
+elif saved_path:
+    # Warm start: this architecture was already trained on this exact dataset
+    model = get_stored_model(saved_path)
+    if model is not None:
         st.session_state['trained_model'] = model
-        st.success(f"{model_choice} Training Complete!")
-        
-        # --- METRICS & DEBUG ---
-        with st.expander("Debug Info", expanded=False):
-            st.write(metrics['debug'])
-
-        c1, c2, c3 = st.columns(3)
-        c1.metric("Precision", f"{metrics['precision']:.2%}")
-        c2.metric("Recall", f"{metrics['recall']:.2%}")
-        c3.metric("F1 Score", f"{metrics['f1']:.2%}")
-        
-        # --- FEATURE IMPORTANCE ---
-        st.subheader("What did this model learn?")
-        importance_df = pd.DataFrame(
-            list(metrics['importance'].items()), 
-            columns=['Feature', 'Importance']
-        ).sort_values(by='Importance', ascending=False).head(10)
-        
-        st.bar_chart(importance_df.set_index('Feature'))
\ No newline at end of file
+        trained_at = pd.Timestamp(model.created, unit='s').strftime('%Y-%m-%d %H:%M')
+        st.caption(f"Loaded saved {model_choice} trained on this dataset ({trained_at}).")
+        show_results(model, model.metrics)
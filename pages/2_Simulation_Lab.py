@@ -1,10 +1,21 @@
 import streamlit as st
-from src.layout import load_sidebar
+from src.layout import load_sidebar, get_stored_model
 from src.schema import DOMAIN_CONFIG
+from src.model_store import find_latest
+from src.hybrid import HybridScorer
+from src.engine import REVIEW_CUTOFF, BLOCK_CUTOFF
 
 st.set_page_config(page_title="Simulation Lab", layout="wide")
 load_sidebar()
 
+if 'trained_model' not in st.session_state and 'domain' in st.session_state:
+    # Warm start from the newest model stored for this domain
+    saved_path = find_latest(st.session_state['domain'])
+    if saved_path:
+        saved_model = get_stored_model(saved_path)
+        if saved_model is not None:
+            st.session_state['trained_model'] = saved_model
+
 if 'trained_model' not in st.session_state:
     st.warning("⚠️ Please train the model in 'Model Analysis' first.")
     st.stop()
@@ -41,9 +52,9 @@ with col1:
 with col2:
     st.subheader("Categorical & Flags")
     for col in config['features']['categorical']:
-        # Fetch options from the trained encoder classes if available
-        if col in model.encoders:
-            options = list(model.encoders[col].classes_)
+        # Fetch options from the classes the transformer saw in training
+        if col in model.transformer.categories:
+            options = list(model.transformer.categories[col])
         else:
             options = ["Unknown"]
         inputs[col] = st.selectbox(f"{col}", options)
@@ -54,22 +65,35 @@ with col2:
 st.divider()
 
 if st.button("Analyze Transaction", type="primary"):
-    risk_prob = model.predict_single(inputs)
-    risk_pct = risk_prob * 100
+    # Same pipeline and cutoffs as the scoring service: rules, model, blend
+    scorer = HybridScorer(model, domain)
+    result = scorer.score_transaction(inputs)
+    risk_prob = result['probability']
     
     c1, c2 = st.columns([1, 2])
     
     with c1:
-        st.metric("Fraud Probability", f"{risk_pct:.1f}%")
+        if risk_prob is None:
+            st.metric("Fraud Probability", "n/a", help="The rules block this transaction on their own, so the model is skipped")
+        else:
+            st.metric("Fraud Probability", f"{risk_prob * 100:.1f}%")
+        st.metric("Rule Score", result['rule_score'])
         
         # Dynamic Threshold Visual
-        if risk_pct > 80:
+        if result['action'] == "BLOCK":
             st.error("🚨 HIGH RISK: BLOCK")
-        elif risk_pct > 50:
+        elif result['action'] == "MANUAL REVIEW":
             st.warning("⚠️ MEDIUM RISK: REVIEW")
         else:
             st.success("✅ LOW RISK: APPROVE")
             
     with c2:
-        st.progress(risk_prob)
-        st.caption("Risk Confidence Score")
\ No newline at end of file
+        st.progress(result['risk_score'] / 100)
+        st.caption(f"Risk Score: {result['risk_score']} / 100 (review above {REVIEW_CUTOFF}, block above {BLOCK_CUTOFF})")
+        for message in result['factors'].values():
+            st.markdown(f"- {message}")
+
+    st.subheader("How could this transaction pass?")
+    # Candidates go through the same rules, model, blend and cutoffs as the result above
+    for tip in scorer.advice(inputs, result):
+        st.markdown(f"- {tip}")
\ No newline at end of file
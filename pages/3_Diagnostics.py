@@ -0,0 +1,68 @@
+# pages/3_Diagnostics.py
+import streamlit as st
+from src.layout import load_sidebar
+from src.engine import AdvancedFraudEngine
+from src.instrumentation import RECORDER, RingBufferSink, SamplingProfiler
+
+# Transactions scored by the profiling run
+PROFILE_ROWS = 500
+
+st.set_page_config(page_title="Diagnostics", layout="wide")
+load_sidebar()
+
+st.title("🩺 Diagnostics")
+st.markdown("Where time and memory went in recent loads, trainings and scorings (this server process).")
+
+ring = RECORDER.sink(RingBufferSink)
+if not RECORDER.enabled or ring is None:
+    st.info("Instrumentation is off (FRAUD_INSTRUMENTATION=0).")
+    st.stop()
+
+summary = ring.summary()
+if summary.empty:
+    st.info("Nothing recorded yet: load data, train or score a transaction first.")
+else:
+    # --- TIME ---
+    st.subheader("Time by span")
+    st.bar_chart(summary.set_index('span')['total_s'])
+    st.dataframe(
+        summary.style.format({
+            'total_s': '{:.3f}', 'mean_ms': '{:.3f}', 'p50_ms': '{:.3f}', 'p95_ms': '{:.3f}',
+            'max_ms': '{:.1f}', 'rss_growth_mb': '{:.0f}', 'share': '{:.1%}',
+        }, na_rep='-'),
+        use_container_width=True
+    )
+    st.caption("rss_growth_mb: how far each span pushed the process's peak resident memory (coarse spans only).")
+
+    counters = ring.totals.counters
+    if counters:
+        st.subheader("Counters")
+        cols = st.columns(min(len(counters), 4))
+        for i, (name, value) in enumerate(sorted(counters.items())):
+            cols[i % len(cols)].metric(name, f"{value:,}")
+
+    with st.expander("Recent spans", expanded=False):
+        st.dataframe(ring.recent(), use_container_width=True)
+
+if st.button("Reset"):
+    ring.clear()
+    st.rerun()
+
+# --- PROFILER ---
+st.divider()
+st.subheader("Sampling profiler")
+model = st.session_state.get('trained_model')
+df = st.session_state.get('current_df')
+if model is None or df is None:
+    st.info("Train or load a model to profile the single-transaction scoring path.")
+elif st.button(f"Profile scoring of {PROFILE_ROWS} transactions"):
+    domain = st.session_state['domain']
+    engine = AdvancedFraudEngine()
+    records = df.head(PROFILE_ROWS).to_dict('records')
+    with st.spinner("Profiling..."):
+        with SamplingProfiler() as profiler:
+            for record in records:
+                engine.analyze_transaction(record, domain)
+                model.predict_single(record)
+    st.dataframe(profiler.top(25).style.format({'self_share': '{:.1%}', 'total_share': '{:.1%}'}), use_container_width=True)
+    st.download_button("Download collapsed stacks (flame graph input)", profiler.collapsed(), file_name="profile.folded")
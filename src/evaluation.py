@@ -0,0 +1,103 @@
+# src/evaluation.py
+import numpy as np
+import pandas as pd
+
+# Cost of a missed fraud relative to a false alarm (a false alarm costs 1).
+# The default threshold minimises FALSE_ALARM_COST * fp + MISSED_FRAUD_COST * fn.
+FALSE_ALARM_COST = 1.0
+MISSED_FRAUD_COST = 20.0
+# Blocking cutoff: the cheapest one when a false block costs as much as a
+# missed fraud, i.e. block where fraud is the likelier outcome
+BLOCK_COSTS = (1.0, 1.0)
+# Points kept when a curve is stored with a model
+CURVE_POINTS = 500
+# Probability bins of histogram_curve (cutoffs every 1/HISTOGRAM_BINS)
+HISTOGRAM_BINS = 10_000
+
+
+def threshold_curve(y_true, probs):
+    """
+    Confusion counts at every distinct probability, from one sort.
+    Row i alerts every transaction with prob > threshold[i]; thresholds sit
+    halfway between neighbouring distinct probabilities, and the first row
+    (threshold 1.0) alerts nothing. Columns: threshold, tp, fp, fn, tn,
+    precision, recall, f1, alert_rate.
+    """
+    y = np.asarray(y_true).astype(bool)
+    p = np.asarray(probs, dtype=np.float64)
+    order = np.argsort(-p, kind='stable')
+    p, y = p[order], y[order]
+
+    tp = np.cumsum(y)
+    fp = np.arange(1, len(y) + 1) - tp
+    # Last row of each run of equal probabilities: ties are alerted together
+    ends = np.r_[np.flatnonzero(p[1:] != p[:-1]), len(p) - 1] if len(p) else np.empty(0, dtype=int)
+    lower = np.r_[p[ends[:-1] + 1], p[-1] - 1e-6] if len(p) else np.empty(0)  # last row alerts everything
+    threshold = (p[ends] + lower) / 2 if len(p) else np.empty(0)
+
+    positives, n = int(y.sum()), len(y)
+    return _curve_frame(np.r_[1.0, threshold], np.r_[0, tp[ends]], np.r_[0, fp[ends]], positives, n)
+
+
+def histogram_curve(counts):
+    """
+    threshold_curve from a probability histogram instead of the probabilities:
+    counts is (bins, 2) negatives/positives, bin k holding probs in
+    (k/bins, (k+1)/bins]. Cutoffs sit on bin edges, so memory is fixed
+    however many rows were scored (see histogram_bins).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    bins = len(counts)
+    filled = np.flatnonzero(counts.sum(axis=1))[::-1]  # non-empty bins, highest first
+    tp = np.cumsum(counts[filled, 1])
+    fp = np.cumsum(counts[filled, 0])
+    threshold = filled / bins
+    if len(filled) and filled[-1] == 0:
+        threshold[-1] = -5e-7  # the lowest bin also holds probs of exactly 0
+    return _curve_frame(np.r_[1.0, threshold], np.r_[0, tp], np.r_[0, fp], int(counts[:, 1].sum()), int(counts.sum()))
+
+
+def histogram_bins(probs, bins=HISTOGRAM_BINS):
+    """Bin index of each probability for histogram_curve."""
+    return np.clip(np.ceil(np.asarray(probs) * bins).astype(np.int64) - 1, 0, bins - 1)
+
+
+def _curve_frame(threshold, tp, fp, positives, n):
+    curve = pd.DataFrame({
+        "threshold": threshold,
+        "tp": tp,
+        "fp": fp,
+        "fn": positives - tp,
+        "tn": (n - positives) - fp,
+    })
+    alerts = tp + fp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        curve["precision"] = np.where(alerts > 0, tp / np.maximum(alerts, 1), 1.0)
+        curve["recall"] = tp / positives if positives else 0.0
+        curve["f1"] = np.where(tp > 0, 2 * tp / (alerts + positives), 0.0)
+        curve["alert_rate"] = alerts / max(n, 1)
+    return curve
+
+
+def expected_cost(curve, false_alarm_cost=FALSE_ALARM_COST, missed_fraud_cost=MISSED_FRAUD_COST):
+    """Cost of each curve row: false alarms and missed frauds weighted by their costs."""
+    return curve["fp"] * false_alarm_cost + curve["fn"] * missed_fraud_cost
+
+
+def optimal_threshold(curve, false_alarm_cost=FALSE_ALARM_COST, missed_fraud_cost=MISSED_FRAUD_COST):
+    """The curve row with the lowest expected cost (as a Series; its 'threshold' is the cutoff)."""
+    return curve.loc[expected_cost(curve, false_alarm_cost, missed_fraud_cost).idxmin()]
+
+
+def thin_curve(curve, points=CURVE_POINTS, keep=()):
+    """
+    At most about `points` rows, evenly spaced in alert count, plus the
+    first and last rows and any row labels in keep, for storing with a model.
+    """
+    if len(curve) <= points:
+        return curve.reset_index(drop=True)
+    alerts = (curve["tp"] + curve["fp"]).to_numpy()
+    targets = np.linspace(0, alerts[-1], points)
+    rows = np.searchsorted(alerts, targets)
+    rows = np.unique(np.r_[0, np.minimum(rows, len(curve) - 1), len(curve) - 1, list(keep)].astype(int))
+    return curve.iloc[rows].reset_index(drop=True)
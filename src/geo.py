@@ -0,0 +1,64 @@
+# src/geo.py
+import math
+import numpy as np
+# Distances run on NumPy alone
+
+EARTH_RADIUS_KM = 6371
+
+
+def to_radians(lat, long, dtype=np.float64):
+    """Degrees -> (phi, lambda) radians arrays in the requested precision."""
+    scale = np.asarray(np.pi / 180, dtype=dtype)
+    return np.multiply(np.asarray(lat), scale, dtype=dtype), np.multiply(np.asarray(long), scale, dtype=dtype)
+
+
+def haversine_rad(phi1, lam1, phi2, lam2, out=None, dtype=np.float64):
+    """
+    Great-circle distance in km between points already in radians.
+    Works through one output buffer and one scratch buffer with in-place
+    ufuncs (no temporaries per step); out can be a preallocated array of
+    the broadcast shape. float32 halves memory and is
+    several times faster, at the cost of metres of error (km near antipodes).
+    """
+    shape = np.broadcast_shapes(np.shape(phi1), np.shape(lam1), np.shape(phi2), np.shape(lam2))
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    scratch = np.empty(shape, dtype=out.dtype)
+
+    np.subtract(phi2, phi1, out=out)          # sin^2(dphi / 2)
+    out *= 0.5
+    np.sin(out, out=out)
+    np.square(out, out=out)
+
+    np.subtract(lam2, lam1, out=scratch)      # cos(phi1) cos(phi2) sin^2(dlambda / 2)
+    scratch *= 0.5
+    np.sin(scratch, out=scratch)
+    np.square(scratch, out=scratch)
+    scratch *= np.cos(phi1)
+    scratch *= np.cos(phi2)
+
+    out += scratch
+    np.clip(out, 0, 1, out=out)
+    np.sqrt(out, out=out)
+    np.arcsin(out, out=out)
+    out *= 2 * EARTH_RADIUS_KM
+    return out
+
+
+def _haversine_scalar(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
+
+
+def haversine(lat1, lon1, lat2, lon2, dtype=np.float64, out=None):
+    """Distance in km between degree coordinates; plain floats in, a plain float out."""
+    if out is None and all(isinstance(v, (int, float)) for v in (lat1, lon1, lat2, lon2)):
+        # One transaction (engine / streaming path): math beats NumPy ufuncs on scalars
+        if any(v != v for v in (lat1, lon1, lat2, lon2)):
+            return math.nan
+        return _haversine_scalar(lat1, lon1, lat2, lon2)
+    phi1, lam1 = to_radians(lat1, lon1, dtype)
+    phi2, lam2 = to_radians(lat2, lon2, dtype)
+    return haversine_rad(phi1, lam1, phi2, lam2, out=out, dtype=dtype)
+
@@ -0,0 +1,325 @@
+# src/graph.py
+import numpy as np
+import pandas as pd
+
+# New accounts from single-edge updates wait in a small dict and are merged
+# into the sorted key index in bulk once there are this many
+PENDING_KEYS = 1 << 16
+# Value of the cash-out features when the account never received money
+NO_INFLOW = -1
+# Idle time (steps, i.e. hours in PaySim) after which a long-running graph forgets an account
+GRAPH_TTL = 24 * 30
+
+GRAPH_COLUMNS = ["dest_fan_in", "dest_pass_through", "dest_cash_out_steps", "orig_cash_out_steps"]
+
+
+def _hash_names(names):
+    # 64-bit content hashes stand in for account names (collisions are
+    # negligible at PaySim scale: ~1e-6 odds for 10M accounts)
+    values = np.asarray(names)
+    if values.dtype.kind in 'OSU':
+        values = values.astype(object)  # hash str names the same way whatever the container
+    return pd.util.hash_array(values)
+
+
+def _to_cents(amount):
+    return np.rint(np.nan_to_num(np.asarray(amount, dtype=np.float64) * 100)).astype(np.int64)
+
+
+def _grown(array, size, fill=0):
+    """Returns array with room for at least size entries (capacity doubles, new slots = fill)."""
+    if size <= len(array):
+        return array
+    bigger = np.full(max(size, 2 * len(array), 1024), fill, dtype=array.dtype)
+    bigger[:len(array)] = array
+    return bigger
+
+
+class AccountGraph:
+    """
+    Balance-flow graph of nameOrig -> nameDest transfers for mule detection.
+    Accounts are interned to int32 ids through a sorted array of name
+    hashes, edges live in growable id/amount/step arrays, and per-account
+    aggregates (transfers in, cents in/out, last inflow step, last cash-out
+    lag) are flat arrays indexed by id, so 6M edges fit in a few hundred MB.
+    Edge features are computed against the graph *before* the edge is added.
+    With a ttl (long-running services) the graph keeps only the per-account
+    aggregates, no edge list, and accounts idle for longer than ttl steps are
+    evicted, which bounds memory to the accounts active in the last 2 * ttl
+    steps (sweeps run at most once per ttl). Edges are expected in step order.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._swept = None  # step of the last eviction sweep
+        self.n_nodes = 0
+        self.n_edges = 0
+        # Account index: sorted hashes -> ids, plus recently added accounts
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._key_ids = np.empty(0, dtype=np.int32)
+        self._pending = {}
+        # Edges
+        self.src = np.empty(0, dtype=np.int32)
+        self.dst = np.empty(0, dtype=np.int32)
+        self.cents = np.empty(0, dtype=np.int64)
+        self.step = np.empty(0, dtype=np.int32)
+        # Per-account aggregates
+        self.in_count = np.empty(0, dtype=np.int32)
+        self.in_cents = np.empty(0, dtype=np.int64)
+        self.out_cents = np.empty(0, dtype=np.int64)
+        self.last_in_step = np.empty(0, dtype=np.int32)
+        self.last_cash_out = np.empty(0, dtype=np.int32)
+        self.last_seen = np.empty(0, dtype=np.int32)
+        self._csr = None
+
+    # --- ACCOUNT INDEX ---
+
+    def _flush(self):
+        if not self._pending:
+            return
+        keys = np.fromiter(self._pending.keys(), dtype=np.uint64, count=len(self._pending))
+        ids = np.fromiter(self._pending.values(), dtype=np.int32, count=len(self._pending))
+        order = np.argsort(keys)
+        at = np.searchsorted(self._keys, keys[order])
+        self._keys = np.insert(self._keys, at, keys[order])
+        self._key_ids = np.insert(self._key_ids, at, ids[order])
+        self._pending = {}
+
+    def _lookup(self, hashes):
+        ids = np.full(len(hashes), -1, dtype=np.int64)
+        if len(self._keys):
+            at = np.minimum(np.searchsorted(self._keys, hashes), len(self._keys) - 1)
+            hit = self._keys[at] == hashes
+            ids[hit] = self._key_ids[at[hit]]
+        return ids
+
+    def _add_nodes(self, count):
+        first = self.n_nodes
+        self.n_nodes += count
+        for name, fill in _NODE_ARRAYS:
+            setattr(self, name, _grown(getattr(self, name), self.n_nodes, fill))
+        return np.arange(first, self.n_nodes, dtype=np.int64)
+
+    def _evict(self, now):
+        """Drops the accounts idle for longer than ttl, renumbering the rest (ttl graphs only)."""
+        if self.ttl is None:
+            return
+        if self._swept is None:
+            self._swept = now
+        if now - self._swept < self.ttl:
+            return
+        self._swept = now
+        self._flush()
+        keep = self.last_seen[:self.n_nodes] >= now - self.ttl
+        if keep.all():
+            return
+        new_ids = (np.cumsum(keep) - 1).astype(np.int32)
+        for name, _ in _NODE_ARRAYS:
+            setattr(self, name, getattr(self, name)[:self.n_nodes][keep])
+        self.n_nodes = int(keep.sum())
+        live = keep[self._key_ids]
+        self._keys, self._key_ids = self._keys[live], new_ids[self._key_ids[live]]
+
+    def intern(self, names):
+        """Account ids for an array of names, adding unseen accounts."""
+        self._flush()
+        hashes = _hash_names(names)
+        ids = self._lookup(hashes)
+        new = ids < 0
+        if new.any():
+            uniques, inverse = np.unique(hashes[new], return_inverse=True)
+            new_ids = self._add_nodes(len(uniques))
+            ids[new] = new_ids[inverse]
+            at = np.searchsorted(self._keys, uniques)
+            self._keys = np.insert(self._keys, at, uniques)
+            self._key_ids = np.insert(self._key_ids, at, new_ids.astype(np.int32))
+        return ids
+
+    def _intern_one(self, name):
+        h = _hash_names([name])
+        found = self._lookup(h)[0]
+        if found >= 0:
+            return int(found)
+        key = int(h[0])
+        if key not in self._pending:
+            self._pending[key] = int(self._add_nodes(1)[0])
+            if len(self._pending) >= PENDING_KEYS:
+                node = self._pending[key]
+                self._flush()
+                return node
+        return self._pending[key]
+
+    # --- UPDATES ---
+
+    def _append_edges(self, o, d, cents, step):
+        if self.ttl is not None:
+            return  # the aggregates are all a ttl graph keeps
+        end = self.n_edges + len(o)
+        self.src, self.dst = _grown(self.src, end), _grown(self.dst, end)
+        self.cents, self.step = _grown(self.cents, end), _grown(self.step, end)
+        self.src[self.n_edges:end], self.dst[self.n_edges:end] = o, d
+        self.cents[self.n_edges:end], self.step[self.n_edges:end] = cents, step
+        self.n_edges = end
+        self._csr = None
+
+    def update(self, orig, dest, amount, step):
+        """Adds one transfer and returns its features (see GRAPH_COLUMNS)."""
+        self._evict(step)
+        o, d = self._intern_one(orig), self._intern_one(dest)
+        cents = int(_to_cents([amount])[0])
+
+        in_cents = self.in_cents[d]
+        last_in = self.last_in_step[o]
+        features = {
+            "dest_fan_in": float(self.in_count[d]),
+            "dest_pass_through": float(self.out_cents[d] / in_cents) if in_cents > 0 else 0.0,
+            "dest_cash_out_steps": float(self.last_cash_out[d]),
+            "orig_cash_out_steps": float(step - last_in) if last_in >= 0 else float(NO_INFLOW),
+        }
+
+        # Money leaves orig (a cash-out if it had received any) and lands at dest
+        self.out_cents[o] += cents
+        if last_in >= 0:
+            self.last_cash_out[o] = step - last_in
+        self.in_count[d] += 1
+        self.in_cents[d] += cents
+        self.last_in_step[d] = step
+        self.last_seen[o] = self.last_seen[d] = step
+        self._append_edges([o], [d], [cents], [step])
+        return features
+
+    def update_batch(self, orig, dest, amount, step):
+        """
+        Vectorized twin of calling update() edge by edge, in order.
+        Within-batch history (earlier edges of the same batch touching an
+        account) is resolved with sorted prefix sums instead of a loop.
+        Returns a frame of GRAPH_COLUMNS, one row per edge.
+        """
+        step = np.asarray(step, dtype=np.int64)
+        if len(step):
+            self._evict(int(step[0]))
+        o, d = self.intern(orig), self.intern(dest)
+        cents = _to_cents(amount)
+        n = len(o)
+        pos = np.arange(n)
+
+        fan_in = self.in_count[d] + _before(d, pos, np.ones(n, dtype=np.int64), d, pos)[0]
+        in_cents = self.in_cents[d] + _before(d, pos, cents, d, pos)[0]
+        out_cents = self.out_cents[d] + _before(o, pos, cents, d, pos)[0]
+
+        last_in, found = _before(d, pos, step, o, pos, last=True)
+        last_in = np.where(found, last_in, self.last_in_step[o])
+        orig_cash_out = np.where(last_in >= 0, step - last_in, NO_INFLOW)
+
+        cashed = orig_cash_out >= 0
+        last_out, found = _before(o[cashed], pos[cashed], orig_cash_out[cashed], d, pos, last=True)
+        dest_cash_out = np.where(found, last_out, self.last_cash_out[d])
+
+        # Fold the batch into the aggregates (last writes per account win)
+        np.add.at(self.in_count, d, 1)
+        np.add.at(self.in_cents, d, cents)
+        np.add.at(self.out_cents, o, cents)
+        _assign_last(self.last_in_step, d, step)
+        _assign_last(self.last_cash_out, o[cashed], orig_cash_out[cashed])
+        np.maximum.at(self.last_seen, o, step)
+        np.maximum.at(self.last_seen, d, step)
+        self._append_edges(o, d, cents, step)
+
+        pass_through = np.divide(out_cents, in_cents, out=np.zeros(n), where=in_cents > 0)
+        return pd.DataFrame({
+            "dest_fan_in": fan_in.astype(np.float64),
+            "dest_pass_through": pass_through,
+            "dest_cash_out_steps": dest_cash_out.astype(np.float64),
+            "orig_cash_out_steps": orig_cash_out.astype(np.float64),
+        })
+
+    # --- ADJACENCY ---
+
+    def in_adjacency(self):
+        """
+        CSR view of incoming transfers: the edges into account i are
+        edge_ids[indptr[i]:indptr[i + 1]] (senders are src[edge_ids]).
+        Built once per batch of updates; graphs with a ttl keep no edges.
+        """
+        if self.ttl is not None:
+            raise ValueError("a graph with a ttl keeps no edge list")
+        if self._csr is None:
+            dst = self.dst[:self.n_edges]
+            edge_ids = np.argsort(dst, kind='stable').astype(np.int32)
+            indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(dst, minlength=self.n_nodes), out=indptr[1:])
+            self._csr = (indptr, edge_ids)
+        return self._csr
+
+    @property
+    def nbytes(self):
+        arrays = (self._keys, self._key_ids, self.src, self.dst, self.cents, self.step, self.in_count,
+                  self.in_cents, self.out_cents, self.last_in_step, self.last_cash_out, self.last_seen)
+        return sum(a.nbytes for a in arrays)
+
+
+# Per-account aggregate arrays and the value new accounts start with
+_NODE_ARRAYS = (("in_count", 0), ("in_cents", 0), ("out_cents", 0),
+                ("last_in_step", NO_INFLOW), ("last_cash_out", NO_INFLOW), ("last_seen", 0))
+
+
+def _assign_last(array, index, values):
+    """array[index] = values where repeated indexes keep their last value."""
+    accounts, first = np.unique(index[::-1], return_index=True)
+    array[accounts] = np.asarray(values)[::-1][first]
+
+
+def _before(event_nodes, event_pos, event_vals, query_nodes, query_pos, last=False):
+    """
+    For each query, the sum (or, with last=True, the latest value) of the
+    events on the same account at strictly earlier positions.
+    Returns (values, found): one sort merges events and queries by
+    (account, position), then a cumulative sum / running max is taken
+    within each account.
+    """
+    m, q = len(event_nodes), len(query_nodes)
+    width = 2 * (max(event_pos.max(initial=0), query_pos.max(initial=0)) + 1)
+    # Same account and position: the query (+0) sorts before the event (+1), so an edge never sees itself
+    merged = np.concatenate([
+        event_nodes * width + 2 * event_pos + 1,
+        query_nodes * width + 2 * query_pos,
+    ])
+    order = np.argsort(merged)
+    nodes = merged[order] // width
+    is_event = order < m
+    vals = np.zeros(m + q, dtype=np.int64)
+    vals[is_event] = np.asarray(event_vals)[order[is_event]]
+
+    idx = np.arange(m + q)
+    starts = np.r_[True, nodes[1:] != nodes[:-1]]
+    group_start = np.maximum.accumulate(np.where(starts, idx, 0))
+    if last:
+        latest = np.maximum.accumulate(np.where(is_event, idx, -1))
+        found = latest >= group_start
+        result = np.where(found, vals[np.maximum(latest, 0)], 0)
+    else:
+        running = np.cumsum(vals)
+        result = running - running[group_start] + vals[group_start]
+        found = np.ones(m + q, dtype=bool)
+
+    queries = ~is_event
+    out, out_found = np.empty(q, dtype=np.int64), np.empty(q, dtype=bool)
+    out[order[queries] - m], out_found[order[queries] - m] = result[queries], found[queries]
+    return out, out_found
+
+
+def add_graph(df, config, graph=None):
+    """Adds the account-graph features of a domain (config['graph']) to a frame; unchanged when unavailable."""
+    spec = config.get('graph')
+    if not spec or not {spec['orig'], spec['dest'], spec['amount'], spec['time']} <= set(df.columns):
+        return df
+    graph = graph if graph is not None else AccountGraph()
+    features = graph.update_batch(df[spec['orig']], df[spec['dest']], df[spec['amount']], df[spec['time']])
+    return df.assign(**{c: features[c].to_numpy(dtype=np.float32) for c in GRAPH_COLUMNS})
+
+
+def with_graph(chunks, config):
+    """Adds account-graph features to a stream of chunks; the graph carries state from chunk to chunk."""
+    graph = AccountGraph()
+    for chunk in chunks:
+        yield add_graph(chunk, config, graph)
@@ -0,0 +1,291 @@
+# src/hybrid.py
+import re
+from itertools import combinations
+import numpy as np
+from src.schema import DOMAIN_CONFIG
+from src.rules import RULES, SCORE_CAP
+from src.engine import AdvancedFraudEngine, ACTIONS, REVIEW_CUTOFF, BLOCK_CUTOFF
+from src.evaluation import threshold_curve, optimal_threshold, BLOCK_COSTS
+from src.ml_logic import FraudModel
+from src.instrumentation import timed, count
+
+# Rule hits are fed to the model as 0/1 columns named RULE_FLAG_PREFIX + rule slug
+RULE_FLAG_PREFIX = "rule_"
+# Share of a labeled frame (its latest rows) held out to learn the blend
+CALIBRATION_FRACTION = 0.3
+# Share of those rows (the earlier part) the blend and its cutoffs are fitted
+# on; the rest only measure the hybrid
+BLEND_FIT_FRACTION = 0.5
+# Model probabilities are kept this far from 0 and 1 before taking logits
+LOGIT_EPS = 1e-6
+# Counterfactual advice: fractional reductions tried per numerical feature
+ADVICE_STEPS = (0.1, 0.3, 0.5, 0.7)
+
+
+def rule_flag_column(name):
+    """Feature column of a rule's hit flag ('Wallet Drain' -> 'rule_wallet_drain')."""
+    return RULE_FLAG_PREFIX + re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def rule_flags(domain, registry=RULES):
+    """Flag column -> factor bit (see decode_factors) for every rule of a domain."""
+    return {rule_flag_column(name): bit for name, bit in registry.factor_bits(domain).items()}
+
+
+def hybrid_config(config, domain, registry=RULES):
+    """Copy of a domain config whose flags also list the domain's rule flag columns."""
+    features = dict(config['features'], flags=config['features']['flags'] + list(rule_flags(domain, registry)))
+    return dict(config, features=features)
+
+
+def add_rule_flags(df, mask, flags):
+    """df plus a float32 0/1 column per rule flag, decoded from an analyze_batch factor mask."""
+    mask = np.asarray(mask)
+    return df.assign(**{col: ((mask >> bit) & 1).astype(np.float32) for col, bit in flags.items()})
+
+
+def fit_blend(probability, rule_score, y):
+    """
+    Logistic regression of the label on (logit of the model probability,
+    rule score / SCORE_CAP): the blend weights as a dict, or None when the
+    labels hold a single class.
+    """
+    from sklearn.linear_model import LogisticRegression
+    y = np.asarray(y)
+    if len(np.unique(y)) < 2:
+        return None
+    p = np.clip(probability, LOGIT_EPS, 1 - LOGIT_EPS)
+    X = np.column_stack([np.log(p / (1 - p)), np.asarray(rule_score, dtype=np.float64) / SCORE_CAP])
+    fit = LogisticRegression().fit(X, y)
+    return {"bias": float(fit.intercept_[0]), "model": float(fit.coef_[0][0]), "rules": float(fit.coef_[0][1])}
+
+
+def blend_probability(blend, probability, rule_score):
+    """Fraud probability of the blend (fit_blend weights) for model probabilities and rule scores."""
+    p = np.clip(np.asarray(probability, dtype=np.float64), LOGIT_EPS, 1 - LOGIT_EPS)
+    z = blend['bias'] + blend['model'] * np.log(p / (1 - p)) + blend['rules'] * np.asarray(rule_score) / SCORE_CAP
+    return 1 / (1 + np.exp(-z))
+
+
+def risk_scale(probability, review, block):
+    """
+    Maps probabilities onto the engine's 0-100 risk scale, linearly between
+    the cutoffs, so that a probability above review scores above
+    REVIEW_CUTOFF and one above block scores above BLOCK_CUTOFF.
+    """
+    review = min(max(review, 0.0), 1 - 2 * LOGIT_EPS)
+    block = min(max(block, review + LOGIT_EPS), 1 - LOGIT_EPS)
+    scaled = np.interp(probability, [0.0, review, block, 1.0], [0, REVIEW_CUTOFF, BLOCK_CUTOFF, SCORE_CAP])
+    return np.ceil(scaled)  # probability cutoffs alert strictly above, like the risk cutoffs
+
+
+class HybridScorer:
+    """
+    Rule engine and FraudModel as one pipeline.
+    The engine runs first on every row; rows it already blocks (score above
+    BLOCK_CUTOFF) skip the model, so model inference falls with the rule hit
+    rate. The rest get the model probability, with the rule hits as features
+    when the model was trained on them (train_hybrid), and both signals are
+    blended into one 0-100 risk score cut at the engine's REVIEW_CUTOFF and
+    BLOCK_CUTOFF, onto which the blend's learned cutoffs are mapped (see
+    risk_scale). Without a blend, the model probability is mapped with the
+    model's own cutoffs and risk is the stronger of the two signals.
+    """
+
+    def __init__(self, model, domain, engine=None, cascade=True):
+        self.model = model
+        self.domain = domain
+        self.engine = engine or AdvancedFraudEngine()
+        self.cascade = cascade
+        # Only models trained on the rule flags get them
+        self.flags = {col: bit for col, bit in rule_flags(domain).items() if col in model.feature_cols}
+
+    def risk(self, probability, rule_score):
+        """Risk score (0-100) of model probabilities and rule scores."""
+        rule_score = np.asarray(rule_score, dtype=np.float64)
+        blend = self.model.blend
+        if blend is None:
+            return np.maximum(risk_scale(probability, self.model.threshold, self.model.block_threshold), rule_score)
+        return risk_scale(blend_probability(blend, probability, rule_score), blend['review'], blend['block'])
+
+    @timed("hybrid.score_batch")
+    def score_batch(self, df):
+        """
+        Scores a DataFrame in one pass. Returns a frame (same index as df) with
+        'probability' (NaN where the cascade skipped the model), 'rule_score',
+        'factors' (bitmask, see decode_factors), 'risk_score' and 'action'.
+        """
+        import pandas as pd
+        rules = self.engine.analyze_batch(df, self.domain)
+        rule_score = rules['score'].to_numpy()
+        mask = rules['factors'].to_numpy()
+
+        open_rows = np.flatnonzero(rule_score <= BLOCK_CUTOFF) if self.cascade else np.arange(len(df))
+        probability = np.full(len(df), np.nan)
+        risk = rule_score.astype(np.int16)  # blocked rows keep their rule score
+        if len(open_rows):
+            frame = df if len(open_rows) == len(df) else df.iloc[open_rows]
+            if self.flags:
+                frame = add_rule_flags(frame, mask[open_rows], self.flags)
+            probability[open_rows] = self.model.predict_batch(frame)
+            risk[open_rows] = self.risk(probability[open_rows], rule_score[open_rows])
+        count("hybrid.model_skipped", len(df) - len(open_rows))
+
+        action = (risk > REVIEW_CUTOFF).view(np.int8) + (risk > BLOCK_CUTOFF).view(np.int8)
+        return pd.DataFrame({
+            "probability": probability,
+            "rule_score": rule_score,
+            "factors": mask,
+            "risk_score": risk,
+            "action": pd.Categorical.from_codes(action, categories=ACTIONS),
+        }, index=df.index)
+
+    def score_transaction(self, record):
+        """
+        Single-transaction twin of score_batch. Returns a dict with
+        'probability' (None when the cascade skipped the model), 'rule_score',
+        'factors' (name -> message), 'type', 'risk_score' and 'action'.
+        """
+        rules = self.engine.analyze_transaction(record, self.domain)
+        probability, risk = None, rules['score']
+        if not (self.cascade and rules['score'] > BLOCK_CUTOFF):
+            if self.flags:
+                hits = {rule_flag_column(name) for name in rules['factors']}
+                record = {**record, **{col: float(col in hits) for col in self.flags}}
+            probability = float(self.model.predict_single(record))
+            risk = int(self.risk(probability, rules['score']))
+        return {
+            "probability": probability,
+            "rule_score": rules['score'],
+            "factors": rules['factors'],
+            "type": rules['type'],
+            "risk_score": risk,
+            "action": ACTIONS[(risk > REVIEW_CUTOFF) + (risk > BLOCK_CUTOFF)],
+        }
+
+    def counterfactuals(self, record, steps=ADVICE_STEPS, pairwise=True):
+        """
+        Batched what-if search over the numerical inputs of one transaction.
+        Every candidate (each feature cut by each step, plus every pair of
+        features cut together) becomes one row of a single score_batch call,
+        so rule hits, rule flags, the blend and the cutoffs are all re-applied.
+        Steps are clipped at each feature's schema minimum, so candidates
+        carry the reduction actually applied (clipped duplicates are dropped).
+        Returns the candidates the pipeline approves, smallest total relative
+        change first.
+        """
+        import pandas as pd
+        numerical = self.model.config['features']['numerical']
+
+        # (feature, new value, actual relative reduction) per distinct clipped step
+        options = {}
+        for col in numerical:
+            value = record.get(col)
+            if col not in self.model.feature_cols or value is None or not value > 0:
+                continue
+            new_values = {max(value * (1 - step), numerical[col]['min']) for step in steps}
+            options[col] = [(col, v, 1 - v / value) for v in sorted(new_values, reverse=True) if v < value]
+        options = {col: opts for col, opts in options.items() if opts}
+        if not options:
+            return []
+
+        candidates = [(change,) for opts in options.values() for change in opts]
+        if pairwise:
+            candidates += [
+                (ca, cb)
+                for a, b in combinations(options, 2)
+                for ca in options[a] for cb in options[b]
+            ]
+
+        # One row per candidate: the record, with each changed column written in one go
+        frame = pd.DataFrame.from_records([record] * len(candidates), index=pd.RangeIndex(len(candidates)))
+        changed = {}
+        for k, changes in enumerate(candidates):
+            for col, value, _ in changes:
+                changed.setdefault(col, []).append((k, value))
+        for col, edits in changed.items():
+            rows, values = zip(*edits)
+            column = frame[col].to_numpy(dtype=np.float64, copy=True)
+            column[list(rows)] = values
+            frame[col] = column
+        risks = self.score_batch(frame)['risk_score'].to_numpy()
+
+        results = []
+        for k in np.flatnonzero(risks <= REVIEW_CUTOFF):
+            changes = candidates[k]
+            results.append({
+                "changes": {col: float(value) for col, value, _ in changes},
+                "reductions": {col: cut for col, _, cut in changes},
+                "risk_score": int(risks[k]),
+                "cost": sum(cut for _, _, cut in changes),
+            })
+        results.sort(key=lambda r: (r['cost'], len(r['changes']), r['risk_score']))
+        return results
+
+    @timed("hybrid.advice")
+    def advice(self, record, result, max_alternatives=3):
+        """What would let a transaction through, given its score_transaction() result."""
+        if result['action'] == "APPROVE":
+            return ["Transaction looks safe."]
+
+        options = self.counterfactuals(record)
+        if not options:
+            return ["Risk pattern is complex (Categorical)."]
+
+        advice = []
+        for option in options[:max_alternatives]:
+            change = " and ".join(f"**{col}** by {step:.0%}" for col, step in option['reductions'].items())
+            advice.append(f"Reducing {change} lowers the risk score to {option['risk_score']} (approve at {REVIEW_CUTOFF} or below).")
+        return advice
+
+
+def train_hybrid(df, domain, model_type="Random Forest", subsample=None, engine=None,
+                 calibration=CALIBRATION_FRACTION, blend_fit=BLEND_FIT_FRACTION):
+    """
+    Trains a FraudModel that sees the rule flags on all but the latest
+    `calibration` share of rows (file order). The earlier `blend_fit` share
+    of those rows learns the blend and its cutoffs (review: cost-optimal
+    under the model's costs, block: under BLOCK_COSTS), and the latest rows
+    measure it. Returns (scorer, metrics): the model's metrics plus 'blend'
+    and 'hybrid' (how the blended actions did on the measuring rows).
+    """
+    engine = engine or AdvancedFraudEngine()
+    flags = rule_flags(domain)
+    rules = engine.analyze_batch(df, domain)
+    frame = add_rule_flags(df, rules['factors'].to_numpy(), flags)
+    cut = len(frame) - int(len(frame) * calibration)
+    split = cut + int((len(frame) - cut) * blend_fit)
+
+    model = FraudModel(frame.iloc[:cut], hybrid_config(DOMAIN_CONFIG[domain], domain), model_type, subsample)
+    metrics = model.train()
+    if "error" in metrics:
+        return None, metrics
+
+    # The blend only ever sees rows the cascade lets through
+    rule_score = rules['score'].to_numpy()[cut:split]
+    scored = rule_score <= BLOCK_CUTOFF
+    fit_rows, rule_score = frame.iloc[cut:split][scored], rule_score[scored]
+    y_fit = model.transformer.target(fit_rows)
+    probability = model.predict_batch(fit_rows)
+    blend = fit_blend(probability, rule_score, y_fit)
+    if blend is not None:
+        curve = threshold_curve(y_fit, blend_probability(blend, probability, rule_score))
+        review = float(optimal_threshold(curve, *model.costs)['threshold'])
+        block = max(float(optimal_threshold(curve, *BLOCK_COSTS)['threshold']), review)
+        blend.update(review=review, block=block)
+    model.blend = blend
+
+    scorer = HybridScorer(model, domain, engine)
+    result = scorer.score_batch(df.iloc[split:])
+    y = model.transformer.target(frame.iloc[split:])
+    alerted = (result['action'] != "APPROVE").to_numpy()
+    tp = int((alerted & (y == 1)).sum())
+    metrics["blend"] = model.blend
+    metrics["hybrid"] = {
+        "precision": tp / max(int(alerted.sum()), 1),
+        "recall": tp / max(int(y.sum()), 1),
+        "alert_rate": float(alerted.mean()) if len(alerted) else 0.0,
+        "model_skipped": float(np.isnan(result['probability']).mean()) if len(result) else 0.0,
+        "rows": len(result),
+    }
+    return scorer, metrics
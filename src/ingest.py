@@ -0,0 +1,159 @@
+# src/ingest.py
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals, is_numeric_dtype, is_bool_dtype
+from src.schema import POSITIVE_LABELS
+from src.validators import read_header, schema_renames
+from src.instrumentation import span, count
+
+CHUNK_ROWS = 100_000
+SAMPLE_ROWS = 50_000
+
+
+def build_dtypes(config):
+    """Explicit read_csv dtypes for a DOMAIN_CONFIG entry (floats downcast, categories as category, plus its "dtypes")."""
+    features = config['features']
+    dtypes = {col: settings.get('dtype', 'float32') for col, settings in features['numerical'].items()}
+    dtypes.update({col: 'category' for col in features['categorical']})
+    dtypes.update({col: 'float32' for col in features['flags']})
+    dtypes.update(config.get('dtypes', {}))
+    return dtypes
+
+
+def domain_columns(config):
+    """Every column a domain can use: features, target and the drop list (needed by derived features)."""
+    features = config['features']
+    cols = list(features['numerical']) + features['categorical'] + features['flags']
+    return list(dict.fromkeys(cols + [config['target']] + config.get('drop_cols', [])))
+
+
+def positive_mask(series):
+    """Vectorized version of the target cleaning rule (NaN counts as negative)."""
+    if is_numeric_dtype(series) or is_bool_dtype(series):
+        # A number prints as one of POSITIVE_LABELS only when it equals 1 ('1', '1.0', 'True')
+        return (series == 1).fillna(False).to_numpy(dtype=bool)
+    # Strings: check each distinct label once, then broadcast by code (NaN -> -1 -> False)
+    codes, uniques = pd.factorize(series)
+    hits = pd.Index(uniques).astype(str).str.strip().isin(POSITIVE_LABELS)
+    return np.append(hits, False)[codes]
+
+
+def reader_args(source, config):
+    """
+    read_csv arguments of a domain CSV, from its header: the schema dtypes,
+    the domain columns it carries (nothing else is parsed), and new names
+    for domain columns the header carries under other names (see
+    schema_renames), so dtypes and usecols apply to them.
+    """
+    wanted = domain_columns(config)
+    header = read_header(source)
+    renames = schema_renames(header, wanted, config.get('domain'))
+    names = [renames.get(c, c) for c in header]
+    args = {"dtype": build_dtypes(config), "usecols": [c for c in names if c in set(wanted)]}
+    if renames:
+        args.update(header=0, names=names)
+    return args
+
+
+def iter_chunks(source, config, chunksize=CHUNK_ROWS, args=None, **read_kwargs):
+    """
+    Streams a CSV (path or uploaded file buffer) as typed DataFrame chunks.
+    Only one chunk is parsed at a time, so memory stays flat for any file size.
+    args: reader_args() of the source, when the caller already has them.
+    """
+    args = dict(args or reader_args(source, config), **read_kwargs)
+    reader = pd.read_csv(source, chunksize=chunksize, **args)
+    with reader:
+        while True:
+            with span("data.parse_csv_chunk"):
+                chunk = next(reader, None)
+            if chunk is None:
+                return
+            count("data.csv_rows", len(chunk))
+            yield chunk
+
+
+def concat_chunks(chunks):
+    """Concatenates typed chunks, unifying per-chunk categories so columns stay categorical."""
+    chunks = [c for c in chunks if len(c)]
+    if not chunks:
+        return pd.DataFrame()
+    cat_cols = [c for c in chunks[0].columns if isinstance(chunks[0][c].dtype, pd.CategoricalDtype)]
+    if cat_cols:
+        unified = {col: union_categoricals([c[col] for c in chunks]).categories for col in cat_cols}
+        chunks = [c.astype({col: pd.CategoricalDtype(cats) for col, cats in unified.items()}) for c in chunks]
+    return pd.concat(chunks)
+
+
+def split_chunks(chunks, row):
+    """
+    Splits one chunk stream at a row number into two: the rows before it and
+    the rest (the chunk holding the boundary is cut in two). Consume the
+    first before the second; nothing is read ahead.
+    """
+    chunks = iter(chunks)
+    boundary = []
+
+    def head():
+        seen = 0
+        for chunk in chunks:
+            if seen + len(chunk) > row:
+                cut = max(row - seen, 0)
+                if cut:
+                    yield chunk.iloc[:cut]
+                boundary.append(chunk.iloc[cut:])
+                return
+            seen += len(chunk)
+            yield chunk
+
+    def tail():
+        yield from boundary
+        yield from chunks
+
+    return head(), tail()
+
+
+def stratified_sample(chunks, target, n_rows=SAMPLE_ROWS, seed=42):
+    """
+    Reservoir sample over a chunk stream that keeps every positive row.
+    Negatives get a random priority and only the lowest ones survive, which
+    is a uniform sample held in bounded memory. Negatives fill whatever the
+    positives leave of n_rows, but never less than half of it, so a common
+    "positive" label (e.g. Refused loans) can't crowd them out. Rows come
+    back in file order.
+    """
+    rng = np.random.default_rng(seed)
+    positives = []
+    n_pos = 0
+    reservoir = None
+    keys = np.empty(0)
+
+    for chunk in chunks:
+        if target in chunk.columns:
+            is_pos = positive_mask(chunk[target])
+        else:
+            is_pos = np.zeros(len(chunk), dtype=bool)
+        if is_pos.any():
+            positives.append(chunk[is_pos])
+            n_pos += int(is_pos.sum())
+
+        negatives = chunk[~is_pos]
+        pool = negatives if reservoir is None else concat_chunks([reservoir, negatives])
+        pool_keys = np.concatenate([keys, rng.random(len(negatives))])
+
+        capacity = max(n_rows - n_pos, n_rows // 2)
+        if len(pool) > capacity:
+            keep = np.sort(np.argpartition(pool_keys, capacity)[:capacity])
+            pool, pool_keys = pool.iloc[keep], pool_keys[keep]
+        reservoir, keys = pool, pool_keys
+
+    parts = positives + ([reservoir] if reservoir is not None else [])
+    return concat_chunks(parts).sort_index()
+
+
+def load_csv(source, config, sample_rows=None, chunksize=CHUNK_ROWS, **read_kwargs):
+    """Reads a domain CSV in chunks; with sample_rows, returns a stratified sample instead of the full file."""
+    chunks = iter_chunks(source, config, chunksize, **read_kwargs)
+    if sample_rows:
+        return stratified_sample(chunks, config['target'], sample_rows)
+    return concat_chunks(chunks)
@@ -0,0 +1,358 @@
+# src/instrumentation.py
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import functools
+from time import perf_counter
+from collections import Counter, deque
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: spans are timed, but peak RSS is not tracked
+    resource = None
+
+# Recent spans kept by the in-memory sink (diagnostics page)
+RING_SIZE = 10_000
+# Seconds between rewrites of the Prometheus text file
+PROMETHEUS_INTERVAL = 10.0
+# Pending events are handed to the sinks in batches of this many, or at once
+# after a span this slow (rare, so the extra work doesn't show)
+DRAIN_EVENTS = 1024
+DRAIN_SECONDS = 0.01
+# Sampling profiler: seconds between stack samples, and frames kept per sample
+PROFILE_INTERVAL = 0.005
+PROFILE_DEPTH = 64
+# ru_maxrss is in KiB on Linux and bytes on macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process so far (MB); None where unavailable."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT / 1e6
+
+
+# --- SINKS ---
+# Sinks receive events in batches: (wall time, name, seconds, peak RSS growth MB)
+# for spans, and (wall time, name, None, n) for counters.
+
+class _Aggregate:
+    """Count / total / max per span name, and value per counter."""
+
+    def __init__(self):
+        self.spans = {}
+        self.counters = Counter()
+
+    def add(self, events):
+        for _, name, seconds, extra in events:
+            if seconds is None:
+                self.counters[name] += extra
+                continue
+            stats = self.spans.get(name)
+            if stats is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+
+
+class RingBufferSink:
+    """Keeps the most recent spans (and running totals) in memory for the diagnostics page."""
+
+    def __init__(self, size=RING_SIZE):
+        self.events = deque(maxlen=size)  # spans only: (wall time, name, seconds, peak RSS growth MB)
+        self.totals = _Aggregate()
+
+    def add(self, events):
+        self.events.extend(e for e in events if e[2] is not None)
+        self.totals.add(events)
+
+    def flush(self):
+        pass
+
+    def clear(self):
+        self.events.clear()
+        self.totals = _Aggregate()
+
+    def summary(self):
+        """One row per span: calls and time since start, latency percentiles of the recent ones."""
+        import pandas as pd  # reports only: recording stays free of pandas
+        recent = pd.DataFrame(list(self.events), columns=["time", "span", "seconds", "rss_growth_mb"])
+        rows = []
+        for name, (calls, total, longest) in self.totals.spans.items():
+            own = recent.loc[recent["span"] == name]
+            p50, p95 = np.percentile(own["seconds"], [50, 95]) * 1000 if len(own) else (np.nan, np.nan)
+            rows.append({
+                "span": name, "calls": calls, "total_s": total, "mean_ms": total / calls * 1000,
+                "p50_ms": p50, "p95_ms": p95, "max_ms": longest * 1000,
+                "rss_growth_mb": pd.to_numeric(own["rss_growth_mb"]).sum(min_count=1),
+            })
+        table = pd.DataFrame(rows, columns=["span", "calls", "total_s", "mean_ms", "p50_ms", "p95_ms", "max_ms", "rss_growth_mb"])
+        table["share"] = table["total_s"] / table["total_s"].sum() if len(table) else []
+        return table.sort_values("total_s", ascending=False, ignore_index=True)
+
+    def recent(self, n=50):
+        import pandas as pd
+        events = list(self.events)[-n:][::-1]
+        frame = pd.DataFrame(events, columns=["time", "span", "seconds", "rss_growth_mb"])
+        frame["time"] = pd.to_datetime(frame["time"], unit="s")
+        return frame
+
+
+class PrometheusFileSink:
+    """
+    Rewrites a Prometheus text-format file (for node_exporter's textfile
+    collector) at most every `interval` seconds and on flush().
+    """
+
+    def __init__(self, path, interval=PROMETHEUS_INTERVAL, prefix="fraud"):
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self.totals = _Aggregate()
+        self._written = 0.0
+
+    def add(self, events):
+        self.totals.add(events)
+        if time.monotonic() - self._written >= self.interval:
+            self.flush()
+
+    def flush(self):
+        p = self.prefix
+        spans = self.totals.spans.items()
+        lines = [
+            f"# TYPE {p}_span_seconds_total counter",
+            *(f'{p}_span_seconds_total{{span="{name}"}} {total:.6f}' for name, (_, total, _) in spans),
+            f"# TYPE {p}_span_calls_total counter",
+            *(f'{p}_span_calls_total{{span="{name}"}} {calls}' for name, (calls, _, _) in spans),
+            f"# TYPE {p}_span_max_seconds gauge",
+            *(f'{p}_span_max_seconds{{span="{name}"}} {longest:.6f}' for name, (_, _, longest) in spans),
+            f"# TYPE {p}_events_total counter",
+            *(f'{p}_events_total{{counter="{name}"}} {value}' for name, value in self.totals.counters.items()),
+        ]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.path)  # scrapers never see a half-written file
+        self._written = time.monotonic()
+
+
+class LogSink:
+    """Emits every span and counter as one JSON log record."""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("fraud.instrumentation")
+        self.level = level
+
+    def add(self, events):
+        for wall, name, seconds, extra in events:
+            if seconds is None:
+                record = {"time": wall, "counter": name, "n": extra}
+            else:
+                record = {"time": wall, "span": name, "ms": round(seconds * 1000, 3), "rss_growth_mb": extra}
+            self.logger.log(self.level, json.dumps(record))
+
+    def flush(self):
+        pass
+
+
+# --- RECORDER ---
+
+class Recorder:
+    """
+    Collects spans and counters and hands them to its sinks in batches.
+    Recording is a lock-free append to a pending queue; the queue is
+    drained into the sinks every DRAIN_EVENTS events, after any span slower
+    than DRAIN_SECONDS, and before reads. Disabled, a span costs one
+    attribute check.
+    """
+
+    def __init__(self, sinks=(), enabled=True):
+        self.sinks = list(sinks)
+        self.enabled = enabled
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        self.drain()
+        self.sinks.append(sink)
+        return sink
+
+    def sink(self, kind):
+        """First sink of a class (e.g. RingBufferSink), drained and ready to read, or None."""
+        self.drain()
+        return next((s for s in self.sinks if isinstance(s, kind)), None)
+
+    def record(self, name, seconds, rss_growth=None):
+        pending = self._pending
+        pending.append((time.time(), name, seconds, rss_growth))
+        if seconds >= DRAIN_SECONDS or len(pending) >= DRAIN_EVENTS:
+            self.drain()
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self._pending.append((time.time(), name, None, n))
+
+    def drain(self):
+        with self._lock:
+            pending, batch = self._pending, []
+            while pending:  # popleft is atomic, so concurrent appends are never lost
+                batch.append(pending.popleft())
+            if batch:
+                for sink in self.sinks:
+                    sink.add(batch)
+
+    def flush(self):
+        self.drain()
+        with self._lock:
+            for sink in self.sinks:
+                sink.flush()
+
+
+class span:
+    """
+    Times a block: `with span("load.csv"):`. With memory=True it also
+    records how much the block raised the process's peak RSS (one syscall
+    on each side, so keep it for coarse spans like loading or training).
+    """
+
+    __slots__ = ("name", "memory", "started", "rss")
+
+    def __init__(self, name, memory=False):
+        self.name = name
+        self.memory = memory
+
+    def __enter__(self):
+        self.rss = peak_rss_mb() if self.memory and RECORDER.enabled else None
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if RECORDER.enabled:
+            seconds = perf_counter() - self.started
+            growth = peak_rss_mb() - self.rss if self.rss is not None else None
+            RECORDER.record(self.name, seconds, growth)
+        return False
+
+
+def timed(name, memory=False):
+    """Decorator form of span(); the wrapper is inlined so hot paths pay well under a microsecond."""
+    def decorate(func):
+        if memory:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not RECORDER.enabled:
+                    return func(*args, **kwargs)
+                with span(name, memory=True):
+                    return func(*args, **kwargs)
+            return wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not RECORDER.enabled:
+                return func(*args, **kwargs)
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                RECORDER.record(name, perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    """Adds n to a named counter (rows loaded, transactions scored...)."""
+    RECORDER.count(name, n)
+
+
+def _from_env():
+    # FRAUD_INSTRUMENTATION=0 turns every span into a no-op;
+    # FRAUD_METRICS_FILE adds a Prometheus text file, FRAUD_METRICS_LOG=1 a JSON log
+    recorder = Recorder([RingBufferSink()], enabled=os.environ.get("FRAUD_INSTRUMENTATION", "1") != "0")
+    if os.environ.get("FRAUD_METRICS_FILE"):
+        recorder.add_sink(PrometheusFileSink(os.environ["FRAUD_METRICS_FILE"]))
+    if os.environ.get("FRAUD_METRICS_LOG") == "1":
+        recorder.add_sink(LogSink())
+    return recorder
+
+
+RECORDER = _from_env()
+
+
+# --- PROFILER ---
+
+class SamplingProfiler:
+    """
+    Opt-in statistical profiler: a background thread samples one thread's
+    Python stack every `interval` seconds. Costs nothing until started and
+    very little while running (no tracing hooks), unlike cProfile.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = Counter()  # stack (outermost first) -> samples
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < PROFILE_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self.thread_id = self.thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def top(self, n=20):
+        """Functions by samples: 'self' where they were running, 'total' where they were on the stack."""
+        import pandas as pd
+        own, total = Counter(), Counter()
+        for stack, hits in self.samples.items():
+            own[stack[-1][:2]] += hits
+            for func in {frame[:2] for frame in stack}:
+                total[func] += hits
+        samples = sum(self.samples.values()) or 1
+        rows = [
+            {"function": name, "file": os.path.relpath(path) if not path.startswith("<") else path,
+             "self": own[(name, path)], "total": hits, "self_share": own[(name, path)] / samples, "total_share": hits / samples}
+            for (name, path), hits in total.items()
+        ]
+        table = pd.DataFrame(rows, columns=["function", "file", "self", "total", "self_share", "total_share"])
+        return table.sort_values(["self", "total"], ascending=False, ignore_index=True).head(n)
+
+    def collapsed(self):
+        """Stacks in collapsed format ('outer;inner count' per line) for flame graph tools."""
+        return "\n".join(
+            ";".join(f"{name} ({os.path.basename(path)}:{line})" for name, path, line in stack) + f" {hits}"
+            for stack, hits in self.samples.most_common()
+        )
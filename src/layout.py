@@ -1,7 +1,11 @@
 # src/layout.py
 import streamlit as st
-import pandas as pd
 import os
+import copy
+from src.schema import DOMAIN_CONFIG
+from src.ingest import SAMPLE_ROWS
+from src.storage import load_dataset, frame_fingerprint
+from src.model_store import load_model, TrainingCache
 
 SAMPLE_DIR = "data/raw"
 FILES = {
@@ -10,6 +14,21 @@ FILES = {
     "Mobile Transaction": "mobile.csv"
 }
 
+# Cached once per process, not redefined on every rerun
+@st.cache_data(show_spinner="Loading data...")
+def read_sample(path, domain):
+    # Stream the whole file and keep a stratified sample: every fraud
+    # case survives, instead of only those in the first N rows.
+    # The first read also writes a typed Parquet copy for later sessions.
+    data = load_dataset(path, DOMAIN_CONFIG[domain], sample_rows=SAMPLE_ROWS)
+    return data, frame_fingerprint(data)
+
+@st.cache_data(show_spinner="Loading data...")
+def read_upload(uploaded, domain):
+    # Full file for uploads; reruns with the same upload skip parsing and hashing
+    data = load_dataset(uploaded, DOMAIN_CONFIG[domain])
+    return data, frame_fingerprint(data)
+
 def load_sidebar():
     with st.sidebar:
         st.header("🗄️ Data Control")
@@ -21,17 +40,14 @@ def load_sidebar():
         
         use_sample = st.toggle("Use Sample Data", value=True)
         df = None
+        source = None  # file on disk, for out-of-core training
 
         if use_sample:
             path = os.path.join(SAMPLE_DIR, FILES[domain])
             if os.path.exists(path):
-                # FIX 1: Increased limit to 50,000 rows to ensure we catch fraud cases
-                # If your machine is slow, lower this to 20,000, but 2k is too small.
-                @st.cache_data
-                def read_data(p): return pd.read_csv(p, nrows=50000) 
-                
                 try:
-                    df = read_data(path)
+                    df, fingerprint = read_sample(path, domain)
+                    source = path
                     st.success(f"Loaded: {FILES[domain]} ({len(df)} rows)")
                 except Exception as e:
                     st.error(f"Error loading file: {e}")
@@ -40,10 +56,29 @@ def load_sidebar():
         else:
             uploaded = st.file_uploader("Upload CSV", type="csv")
             if uploaded:
-                df = pd.read_csv(uploaded) # Load full file for uploads
+                df, fingerprint = read_upload(uploaded, domain)
 
         if df is not None:
             st.session_state['current_df'] = df
             st.session_state['domain'] = domain
+            st.session_state['data_fingerprint'] = fingerprint
+            st.session_state['data_source'] = source
         
-    return df
\ No newline at end of file
+    return df
+
+@st.cache_resource
+def _stored_model(path):
+    return load_model(path)
+
+def get_stored_model(path):
+    """
+    A persisted FraudModel, loaded once per process. Each caller gets a
+    shallow copy (see TrainingCache), so no session can change another's model.
+    """
+    model = _stored_model(path)
+    return None if model is None else copy.copy(model)
+
+@st.cache_resource
+def get_training_cache():
+    """Process-wide LRU of trained models (see TrainingCache), so repeat trainings return at once."""
+    return TrainingCache()
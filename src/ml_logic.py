@@ -1,132 +1,320 @@
 # src/ml_logic.py
-import pandas as pd
+import threading
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import precision_score, recall_score, f1_score
+import time
+from src.preprocessing import DomainTransformer
+from src.evaluation import (
+    threshold_curve, histogram_curve, histogram_bins, optimal_threshold, thin_curve,
+    FALSE_ALARM_COST, MISSED_FRAUD_COST, BLOCK_COSTS, HISTOGRAM_BINS,
+)
+from src.ingest import positive_mask, split_chunks, stratified_sample
+from src.storage import open_dataset
+from src.velocity import with_velocity
+from src.graph import with_graph
+from src.instrumentation import timed, count, peak_rss_mb
+
+# Fast mode: cap on training rows (all fraud kept, negatives downsampled and re-weighted)
+SUBSAMPLE_ROWS = 100_000
+# HistGradientBoosting bins categories natively only up to this many levels
+MAX_NATIVE_CATEGORIES = 255
+# Out-of-core training: share of the file (its end, i.e. the latest rows) held out for validation
+HOLDOUT_FRACTION = 0.2
+# Test rows used for permutation importance
+IMPORTANCE_ROWS = 5000
+
+# --- MODEL SELECTION LOGIC ---
+# sklearn takes over a second to import, so each backend imports its estimator
+# when a model is built; stored models bring it in when they are unpickled
+def _random_forest(categorical_mask):
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(
+        n_estimators=100, 
+        max_depth=None, 
+        random_state=42, 
+        class_weight='balanced_subsample', # Excellent for fraud
+        n_jobs=-1 # Trees are independent: use every core
+    )
+
+def _hist_gradient_boosting(categorical_mask):
+    # Histogram binning makes each split O(bins) instead of O(rows), and
+    # label-encoded columns are split as true categories instead of ordinals
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    return HistGradientBoostingClassifier(
+        max_iter=200,
+        learning_rate=0.1,
+        categorical_features=categorical_mask if any(categorical_mask) else None,
+        class_weight='balanced',
+        random_state=42
+    )
+
+def _gradient_boosting(categorical_mask):
+    # Gradient Boosting is more sensitive but often more precise
+    # Note: Standard GBM in sklearn doesn't support 'class_weight' natively
+    # so we often handle it by undersampling or tuning the threshold.
+    from sklearn.ensemble import GradientBoostingClassifier
+    return GradientBoostingClassifier(
+        n_estimators=100,
+        learning_rate=0.1,
+        max_depth=5,
+        random_state=42
+    )
+
+MODEL_BACKENDS = {
+    "Random Forest": _random_forest,
+    "Hist Gradient Boosting": _hist_gradient_boosting,
+    "Gradient Boosting": _gradient_boosting,
+}
+# Backends that accept NaN (unseen categories, see DomainTransformer); the rest get a sentinel code
+NAN_BACKENDS = {"Random Forest", "Hist Gradient Boosting"}
 
 class FraudModel:
-    def __init__(self, df, config, model_type="Random Forest"):
+    def __init__(self, df, config, model_type="Random Forest", subsample=None,
+                 false_alarm_cost=FALSE_ALARM_COST, missed_fraud_cost=MISSED_FRAUD_COST):
         self.raw_df = df
         self.config = config
         self.model_type = model_type
-        self.encoders = {}
-        self.feature_cols = []
+        self.transformer = DomainTransformer(config, unknown_as_nan=model_type in NAN_BACKENDS)
         self.debug_info = {}
+        self.threshold = 0.25  # Replaced by the cost-optimal cutoff after training
+        self.block_threshold = 0.5  # Replaced by the BLOCK_COSTS cutoff after training
+        self.costs = (false_alarm_cost, missed_fraud_cost)
+        self.metrics = None
+        self.blend = None  # Rule/model blend weights learned by src/hybrid.py
+        self._local = threading.local()
         
-        # --- MODEL SELECTION LOGIC ---
-        if self.model_type == "Random Forest":
-            self.model = RandomForestClassifier(
-                n_estimators=100, 
-                max_depth=None, 
-                random_state=42, 
-                class_weight='balanced_subsample' # Excellent for fraud
-            )
-        elif self.model_type == "Gradient Boosting":
-            # Gradient Boosting is more sensitive but often more precise
-            self.model = GradientBoostingClassifier(
-                n_estimators=100,
-                learning_rate=0.1,
-                max_depth=5,
-                random_state=42
-            )
-            # Note: Standard GBM in sklearn doesn't support 'class_weight' natively
-            # so we often handle it by undersampling or tuning the threshold.
+        self.subsample = subsample
+        self.model = None  # Built by train() once the categorical columns are known
 
-    def preprocess(self):
-        df_clean = self.raw_df.copy().fillna(0)
-        
-        # 1. DROP FORBIDDEN COLS
-        drop_list = self.config.get('drop_cols', [])
-        df_clean = df_clean.drop(columns=[c for c in drop_list if c in df_clean.columns], errors='ignore')
-        
-        # 2. GET TARGET
-        target = self.config['target']
-        if target not in df_clean.columns:
-            raise ValueError(f"Target '{target}' not found!")
+    @property
+    def feature_cols(self):
+        return self.transformer.feature_cols
 
-        # Robust Target Cleaning
-        y_raw = df_clean[target].astype(str).str.strip()
-        df_clean[target] = y_raw.apply(lambda x: 1 if x in ['1', '1.0', 'Yes', 'True', 'Refused', 'Fraud', 'TARGET'] else 0)
-        
-        self.debug_info['class_distribution'] = df_clean[target].value_counts().to_dict()
-        
-        # 3. FEATURES
-        nums = list(self.config['features']['numerical'].keys())
-        cats = self.config['features']['categorical']
-        flags = self.config['features']['flags']
-        
-        self.feature_cols = [c for c in nums + cats + flags if c in df_clean.columns]
-        
-        # Encode
-        for col in cats:
-            if col in df_clean.columns:
-                le = LabelEncoder()
-                df_clean[col] = le.fit_transform(df_clean[col].astype(str))
-                self.encoders[col] = le
-                
-        return df_clean[self.feature_cols], df_clean[target]
+    @timed("model.preprocess", memory=True)
+    def preprocess(self):
+        """
+        Fits the domain transformer on the raw frame.
+        Returns (X, y): a column-major float32 matrix in feature_cols order
+        and an int8 label vector.
+        """
+        X, y = self.transformer.fit_transform(self.raw_df)
+        self.debug_info['class_distribution'] = {0: int(len(y) - y.sum()), 1: int(y.sum())}
+        return X, y
 
+    @timed("model.train", memory=True)
     def train(self):
         X, y = self.preprocess()
-        
+        self.raw_df = None  # the fitted transformer is all serving needs; don't pin the frame
+
         # Safety Check
-        if 1 not in y.values:
+        if not y.any():
             return {"error": "NO FRAUD FOUND in data subset."}
 
+        from sklearn.model_selection import train_test_split
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, stratify=y, random_state=42)
-        
-        self.model.fit(X_train, y_train)
-        
+        weights = None
+        if self.subsample and len(X_train) > self.subsample:
+            X_train, y_train, weights = self._downsample(X_train, y_train, self.subsample)
+        train_seconds, rss_growth = self._fit(X_train, y_train, weights)
+
         # --- THRESHOLD TUNING ---
-        # GBMs often output very low probabilities for everything, so we lower the bar.
+        # One sort of the test probabilities gives every cutoff; the model keeps
+        # the cheapest one (GBMs often score everything low, so no fixed bar fits all)
         probs = self.model.predict_proba(X_test)[:, 1]
-        threshold = 0.25  # Sensitivity tuning
-        preds = (probs > threshold).astype(int)
-        
+        curve = threshold_curve(y_test, probs)
+        return self._finish(curve, X_test, y_test, len(X_train), train_seconds, rss_growth)
+
+    @timed("model.train_stream", memory=True)
+    def train_stream(self, source, name=None, holdout=HOLDOUT_FRACTION):
+        """
+        Out-of-core train() for datasets too big to load: one pass over the
+        file in fixed memory. The last `holdout` share of rows (file order,
+        which the velocity features already take as time order) is the
+        validation set. Rows before it feed a reservoir that keeps every fraud
+        row and samples negatives to fit `subsample` rows, re-weighted by
+        1/rate; the model is fitted on it when the stream reaches the holdout,
+        which is then scored chunk by chunk into a probability histogram.
+        Only the account graph of graph domains (src/graph.py) grows with
+        the file. Returns the same metrics as train(), plus holdout_rows.
+        """
+        max_rows = self.subsample or SUBSAMPLE_ROWS
+        target = self.config['target']
+        total, chunks = open_dataset(source, self.config, name)
+        chunks = with_graph(with_velocity(chunks, self.config), self.config)
+        before, after = split_chunks(chunks, total - int(total * holdout))
+
+        seen = np.zeros(2, dtype=np.int64)  # negatives, positives streamed before the holdout
+
+        def tally(stream):
+            for chunk in stream:
+                if target in chunk.columns:
+                    n_pos = int(positive_mask(chunk[target]).sum())
+                    seen[:] += (len(chunk) - n_pos, n_pos)
+                yield chunk
+
+        self.raw_df = stratified_sample(tally(before), target, max_rows)
+        X_train, y_train = self.preprocess()
+        self.raw_df = None
+        self.debug_info['class_distribution'] = {0: int(seen[0]), 1: int(seen[1])}
+        if not y_train.any():
+            return {"error": "NO FRAUD FOUND in data subset."}
+
+        # Weight correction: each kept negative stands for seen/kept of them
+        kept_neg = len(y_train) - int(y_train.sum())
+        weights = np.where(y_train == 1, 1.0, seen[0] / kept_neg) if 0 < kept_neg < seen[0] else None
+        train_rows = len(X_train)
+        train_seconds, rss_growth = self._fit(X_train, y_train, weights)
+        del X_train, y_train, weights
+
+        counts = np.zeros((HISTOGRAM_BINS, 2), dtype=np.int64)
+        X_test, y_test = [], []
+        n_test = 0
+        for chunk in after:
+            X_chunk, y_chunk = self.transformer.transform(chunk), self.transformer.target(chunk)
+            probs = self.model.predict_proba(X_chunk)[:, 1]
+            counts += np.bincount(histogram_bins(probs) * 2 + y_chunk, minlength=HISTOGRAM_BINS * 2).reshape(-1, 2)
+            if n_test < IMPORTANCE_ROWS:
+                X_test.append(X_chunk[:IMPORTANCE_ROWS - n_test])
+                y_test.append(y_chunk[:IMPORTANCE_ROWS - n_test])
+                n_test += len(X_test[-1])
+        if not counts.any():
+            return {"error": "No rows left for validation: the file is too small for a holdout."}
+
+        metrics = self._finish(
+            histogram_curve(counts), np.concatenate(X_test), np.concatenate(y_test),
+            train_rows, train_seconds, rss_growth
+        )
+        metrics["holdout_rows"] = int(counts.sum())
+        return metrics
+
+    def _fit(self, X_train, y_train, weights):
+        """
+        Builds the backend estimator and fits it. Returns (seconds, MB the fit
+        raised the process's peak RSS by, None where RSS isn't available).
+        """
+        categorical_mask = [
+            col in self.transformer.categories
+            and len(self.transformer.categories[col]) <= MAX_NATIVE_CATEGORIES
+            for col in self.feature_cols
+        ]
+        self.model = MODEL_BACKENDS[self.model_type](categorical_mask)
+        # Down-sampling weights already restore the true class mix; stacking
+        # class_weight on top would undo them, so only one correction applies
+        if weights is not None and 'class_weight' in self.model.get_params():
+            self.model.set_params(class_weight=None)
+
+        # Fit on a plain float32 matrix: the trees work in float32 anyway, and
+        # serving can then pass arrays without feature-name checks
+        # (peak RSS rather than tracemalloc: it sees the native buffers of the fit
+        # and doesn't slow the timed call down)
+        rss = peak_rss_mb()
+        started = time.perf_counter()
+        self.model.fit(X_train, y_train, sample_weight=weights)
+        train_seconds = time.perf_counter() - started
+        return train_seconds, None if rss is None else peak_rss_mb() - rss
+
+    def _finish(self, curve, X_test, y_test, train_rows, train_seconds, rss_growth):
+        """Adopts the cost-optimal cutoffs of a validation curve and builds the metrics dict."""
+        best = optimal_threshold(curve, *self.costs)
+        self.threshold = float(best['threshold'])
+        self.block_threshold = max(float(optimal_threshold(curve, *BLOCK_COSTS)['threshold']), self.threshold)
+
         metrics = {
-            "precision": precision_score(y_test, preds, zero_division=0),
-            "recall": recall_score(y_test, preds, zero_division=0),
-            "f1": f1_score(y_test, preds, zero_division=0),
-            "importance": dict(zip(self.feature_cols, self.model.feature_importances_)),
-            "debug": self.debug_info
+            "precision": float(best['precision']),
+            "recall": float(best['recall']),
+            "f1": float(best['f1']),
+            "threshold": self.threshold,
+            "block_threshold": self.block_threshold,
+            "alert_rate": float(best['alert_rate']),
+            "costs": {"false_alarm": self.costs[0], "missed_fraud": self.costs[1]},
+            "curve": thin_curve(curve, keep=[best.name]),
+            "importance": self._feature_importance(X_test, y_test),
+            "debug": self.debug_info,
+            "backend": self.model_type,
+            "train_rows": train_rows,
+            "train_seconds": train_seconds,
+            # Growth of the process's peak RSS during the fit: native allocations
+            # included, 0 when the fit stays under an earlier peak
+            "fit_rss_growth_mb": rss_growth,
         }
+        self.metrics = metrics
         return metrics
 
+    @staticmethod
+    def _downsample(X, y, max_rows, seed=42):
+        """Keeps every fraud row, samples negatives to fit max_rows and re-weights them by 1/rate."""
+        pos = np.flatnonzero(y == 1)
+        neg = np.flatnonzero(y != 1)
+        n_neg = max(max_rows - len(pos), 1)
+        if n_neg >= len(neg):
+            return X, y, None
+        keep_neg = np.random.default_rng(seed).choice(neg, n_neg, replace=False)
+        keep = np.sort(np.concatenate([pos, keep_neg]))
+        weights = np.where(y[keep] == 1, 1.0, len(neg) / n_neg)
+        return X[keep], y[keep], weights
+
+    def _feature_importance(self, X_test, y_test, max_rows=IMPORTANCE_ROWS):
+        if hasattr(self.model, 'feature_importances_'):
+            return dict(zip(self.feature_cols, self.model.feature_importances_))
+        # Boosters without impurity importances: permutation importance on a slice of the test set
+        from sklearn.inspection import permutation_importance
+        # Scored by average precision: accuracy barely moves when ~1% of rows are fraud
+        result = permutation_importance(
+            self.model, X_test[:max_rows], y_test[:max_rows],
+            scoring='average_precision', n_repeats=3, random_state=42
+        )
+        return dict(zip(self.feature_cols, result.importances_mean))
+
+    def to_artifacts(self):
+        """Everything needed to serve this model again, without the training frame."""
+        return {
+            "model_type": self.model_type,
+            "config": self.config,
+            "estimator": self.model,
+            "transformer": self.transformer,
+            "threshold": self.threshold,
+            "block_threshold": self.block_threshold,
+            "metrics": self.metrics,
+            "blend": self.blend,
+        }
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        """Rebuilds a fitted FraudModel from to_artifacts() output (see src/model_store.py)."""
+        model = cls(None, artifacts['config'], artifacts['model_type'])
+        model.model = artifacts['estimator']
+        model.transformer = artifacts['transformer']
+        model.threshold = artifacts['threshold']
+        model.block_threshold = artifacts['block_threshold']
+        model.metrics = artifacts['metrics']
+        model.blend = artifacts.get('blend')
+        model.costs = (model.metrics['costs']['false_alarm'], model.metrics['costs']['missed_fraud'])
+        model.fingerprint = artifacts.get('fingerprint')
+        model.created = artifacts.get('created')
+        model.training_key = artifacts.get('training_key')
+        return model
+
+    def set_threshold(self, threshold):
+        """Moves the review cutoff (e.g. to one re-picked on the stored curve); the block cutoff never sits below it."""
+        self.threshold = float(threshold)
+        self.block_threshold = max(self.block_threshold, self.threshold)
+
+    def _row_buffer(self):
+        # One preallocated row per thread (Streamlit sessions share cached models)
+        row = getattr(self._local, 'row', None)
+        if row is None or row.shape[1] != len(self.feature_cols):
+            row = self._local.row = np.zeros((1, len(self.feature_cols)), dtype=np.float32)
+        return row
+
+    def encode_single(self, input_dict):
+        """Encodes one transaction dict into the preallocated float32 feature row."""
+        return self.transformer.transform(input_dict, out=self._row_buffer())
+
+    @timed("model.predict_single")
     def predict_single(self, input_dict):
-        # (Same implementation as previous step...)
-        row = pd.DataFrame([input_dict])
-        for col, le in self.encoders.items():
-            if col in row:
-                val = str(row[col][0])
-                if val in le.classes_:
-                    row[col] = le.transform([val])[0]
-                else:
-                    row[col] = 0 
-        
-        for col in self.feature_cols:
-            if col not in row:
-                row[col] = 0
-                
-        return self.model.predict_proba(row[self.feature_cols])[0][1]
-    
-    def generate_advice(self, input_dict, current_risk):
-        # (Same implementation as previous step...)
-        advice = []
-        if current_risk < 0.50: return ["Transaction looks safe."]
-        
-        for col in self.config['features']['numerical']:
-            if col in input_dict:
-                original_val = input_dict[col]
-                if original_val <= 0: continue
-                
-                # Try reducing value
-                test_inputs = input_dict.copy()
-                test_inputs[col] = original_val * 0.7 # Reduce by 30%
-                new_risk = self.predict_single(test_inputs)
-                
-                if new_risk < 0.50:
-                    advice.append(f"Reducing **{col}** significantly lowers risk.")
-                    break
-        return advice if advice else ["Risk pattern is complex (Categorical)."]
\ No newline at end of file
+        return self.model.predict_proba(self.encode_single(input_dict))[0][1]
+
+    @timed("model.predict_batch")
+    def predict_batch(self, df):
+        """Fraud probabilities for every row of a DataFrame, through the same transformer as training."""
+        count("model.rows_scored", len(df))
+        return self.model.predict_proba(self.transformer.transform(df))[:, 1]
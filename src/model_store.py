@@ -0,0 +1,114 @@
+# src/model_store.py
+import os
+import re
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import joblib
+from src.ml_logic import FraudModel
+
+MODEL_DIR = "data/models"
+ARTIFACT_VERSION = 7
+# Memory budget of the in-process training cache (stored artifact sizes)
+TRAINING_CACHE_MB = 512
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+
+
+def model_dir(domain, model_type=None, fingerprint=None):
+    """Store layout: data/models/<domain>/<model type>/<dataset fingerprint>/<timestamp>.joblib"""
+    parts = [MODEL_DIR, _slug(domain)]
+    if model_type:
+        parts.append(_slug(model_type))
+        if fingerprint:
+            parts.append(fingerprint)
+    return os.path.join(*parts)
+
+
+def save_model(model: FraudModel, domain, fingerprint, key=None):
+    """Persists a trained model with its fitted transformer, threshold and metrics (key: its training_key). Returns the path."""
+    folder = model_dir(domain, model.model_type, fingerprint)
+    os.makedirs(folder, exist_ok=True)
+    created = time.time()
+    bundle = {
+        "version": ARTIFACT_VERSION,
+        "domain": domain,
+        "fingerprint": fingerprint,
+        "created": created,
+        "training_key": key,
+        **model.to_artifacts(),
+    }
+    # Millisecond timestamps keep file names sortable by age
+    path = os.path.join(folder, f"{int(created * 1000)}.joblib")
+    tmp_path = path + '.tmp'
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def find_latest(domain, model_type=None, fingerprint=None):
+    """Newest stored model for a domain, optionally narrowed to an architecture and dataset."""
+    root = model_dir(domain, model_type, fingerprint)
+    latest = None
+    for folder, _, files in os.walk(root):
+        for name in files:
+            if name.endswith('.joblib') and (latest is None or name > os.path.basename(latest)):
+                latest = os.path.join(folder, name)
+    return latest
+
+
+def load_model(path):
+    """Loads a stored model; returns None for artifacts written by an incompatible version."""
+    bundle = joblib.load(path)
+    if bundle.get('version') != ARTIFACT_VERSION:
+        return None
+    return FraudModel.from_artifacts(bundle)
+
+
+def training_key(fingerprint, config, model_type, **params):
+    """Content address of a training run: dataset fingerprint + domain config + architecture + hyperparameters."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([fingerprint, config, model_type, params], sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class TrainingCache:
+    """
+    Trained models by training_key, shared by every session of the process.
+    Least recently used models are evicted once their stored artifact sizes
+    add up to more than max_bytes. Models go in and come out as shallow
+    copies: the fitted estimator and transformer are shared read-only, while
+    attributes a session may set (threshold, blend) stay its own.
+    """
+
+    def __init__(self, max_bytes=TRAINING_CACHE_MB * 1e6):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._models = OrderedDict()  # key -> (model, size); least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                return None
+            self._models.move_to_end(key)
+            return copy.copy(entry[0])
+
+    def put(self, key, model, nbytes):
+        with self._lock:
+            if key in self._models:
+                self.nbytes -= self._models.pop(key)[1]
+            self._models[key] = (copy.copy(model), nbytes)
+            self.nbytes += nbytes
+            # Always keep the newest model, even when it alone is over budget
+            while self.nbytes > self.max_bytes and len(self._models) > 1:
+                self.nbytes -= self._models.popitem(last=False)[1][1]
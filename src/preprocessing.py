@@ -0,0 +1,136 @@
+# src/preprocessing.py
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from src.ingest import positive_mask
+
+# Code for categories never seen in training: NaN, which RandomForest and
+# HistGB route as missing instead of lumping it with a trained class (a
+# negative code would sort next to class 0 and be split with it)
+UNKNOWN_CODE = np.nan
+# Missing values are filled with 0 before encoding, so they become the '0' class
+MISSING_LABEL = '0'
+
+
+class DomainTransformer:
+    """
+    Fitted preprocessing for one DOMAIN_CONFIG entry: target cleaning, drop
+    list, NaN filling and categorical encoding in one object.
+    The same transform() runs on a DataFrame of any size and on a single
+    transaction dict, so training and serving share one code path, and the
+    transformer is pickled next to the estimator so they cannot drift.
+    Estimators that reject NaN pass unknown_as_nan=False: unseen categories
+    then get the code after the column's last class, which no trained class shares.
+    """
+
+    def __init__(self, config, unknown_as_nan=True):
+        self.config = config
+        self.unknown_as_nan = unknown_as_nan
+        self.feature_cols = []
+        self.categories = {}  # column -> sorted array of the string classes seen in training
+        self._plan = None     # [(column, {class: code} or None, unknown code)], built on first single-row use
+
+    @property
+    def is_fitted(self):
+        return bool(self.feature_cols)
+
+    def target(self, df):
+        """Cleans the target column into an int8 0/1 vector."""
+        target = self.config['target']
+        if target not in df.columns:
+            raise ValueError(f"Target '{target}' not found!")
+        return positive_mask(df[target]).astype(np.int8)
+
+    def fit(self, df):
+        """Learns the feature columns (never from the drop list) and the classes of each categorical."""
+        features = self.config['features']
+        drop_list = set(self.config.get('drop_cols', []))
+        cats = set(features['categorical'])
+        candidates = list(features['numerical']) + features['categorical'] + features['flags']
+
+        self.feature_cols = [c for c in candidates if c in df.columns and c not in drop_list]
+        self.categories = {}
+        self._plan = None
+        for col in self.feature_cols:
+            if col in cats:
+                codes, uniques = pd.factorize(df[col])
+                labels = _as_labels(uniques)
+                if (codes < 0).any():
+                    labels = np.append(labels, MISSING_LABEL)
+                self.categories[col] = np.unique(labels)
+        return self
+
+    def fit_transform(self, df):
+        """Fits on a training frame. Returns (X, y)."""
+        self.fit(df)
+        return self.transform(df), self.target(df)
+
+    def transform(self, data, out=None):
+        """
+        Encodes a DataFrame, or one transaction dict, into a float32 matrix
+        in feature_cols order. Missing features are filled like NaN (0 / '0');
+        unseen categories get UNKNOWN_CODE (see unknown_as_nan), the only NaN
+        left in the output. out, when given, is a preallocated
+        (n, n_features) buffer that is filled in place.
+        """
+        one_row = isinstance(data, Mapping)
+        n = 1 if one_row else len(data)
+        if out is None:
+            out = np.empty((n, len(self.feature_cols)), dtype=np.float32, order='F')
+        if one_row:
+            out[0] = self._encode_one(data)
+            return out
+
+        for j, col in enumerate(self.feature_cols):
+            classes = self.categories.get(col)
+            if col not in data.columns:
+                out[:, j] = 0 if classes is None else self._encode(classes, [MISSING_LABEL])
+            elif classes is None:
+                column = out[:, j]
+                column[:] = pd.to_numeric(data[col], errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+                np.copyto(column, 0, where=np.isnan(column))
+            else:
+                # Encode each distinct value once, then broadcast by code (NaN -> trailing '0')
+                codes, uniques = pd.factorize(data[col])
+                labels = np.append(_as_labels(uniques), MISSING_LABEL)
+                out[:, j] = self._encode(classes, labels)[codes]
+        return out
+
+    def _encode_one(self, data):
+        # The serving path (p50 < 10 us, see benchmarks/run.py): one plain list, filled from
+        # a plan compiled once; pd.isna only for values that aren't a str, int or float
+        plan = getattr(self, '_plan', None)
+        if plan is None:
+            plan = self._plan = [
+                (col, None, None) if classes is None else
+                (col, {c: i for i, c in enumerate(classes)}, self._unknown(classes))
+                for col, classes in ((col, self.categories.get(col)) for col in self.feature_cols)
+            ]
+        row = []
+        for col, codes, unknown in plan:
+            value = data.get(col)
+            kind = type(value)
+            missing = value != value if kind is float else (kind is not str and kind is not int and pd.isna(value))
+            if codes is None:
+                row.append(0 if missing else value)
+            else:
+                # Same classes and codes as _encode, as a dict lookup (no array setup for one value)
+                row.append(codes.get(MISSING_LABEL if missing else (value if kind is str else str(value)), unknown))
+        return row
+
+    def _unknown(self, classes):
+        return UNKNOWN_CODE if self.unknown_as_nan else len(classes)
+
+    def _encode(self, classes, labels):
+        labels = np.asarray(labels, dtype=str)
+        if not len(classes):
+            return np.full(len(labels), self._unknown(classes), dtype=np.float32)
+        if labels.dtype.itemsize > classes.dtype.itemsize:
+            # Compare at the longer width so long labels aren't truncated into a match
+            classes = classes.astype(labels.dtype)
+        pos = np.minimum(np.searchsorted(classes, labels), len(classes) - 1)
+        return np.where(classes[pos] == labels, pos, self._unknown(classes)).astype(np.float32)
+
+
+def _as_labels(values):
+    return pd.Index(values).astype(str).to_numpy(dtype=str)
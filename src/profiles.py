@@ -0,0 +1,209 @@
+# src/profiles.py
+import os
+import json
+import time
+import argparse
+import numpy as np
+from src.schema import DOMAIN_CONFIG
+# The engine only needs load_context() and customer_key(), so the builder's
+# dependencies (pandas, joblib, the data loaders) are imported where profiles are built
+
+PROFILE_DIR = "data/profiles"
+PROFILE_TABLE = "card_thresholds.json"
+PROFILE_SKETCH = "card_sketch.joblib"
+PROFILE_VERSION = 1
+
+# Amount above which a purchase counts as a spike for its category (or card + category)
+THRESHOLD_QUANTILE = 0.99
+# A card needs this much history in a category before its own quantile is trusted
+MIN_CUSTOMER_HISTORY = 20
+# Floats hold every integer exactly only below this
+FLOAT_EXACT = 2 ** 53
+
+# Log-spaced amount bins: bin b covers [MIN_AMOUNT * GAMMA**(b-1), MIN_AMOUNT * GAMMA**b),
+# so any quantile is off by at most ~2.5% of its value; bin 0 holds amounts <= 0
+SKETCH_GAMMA = 1.05
+SKETCH_MIN_AMOUNT = 0.01
+SKETCH_BINS = int(np.ceil(np.log(1e8 / SKETCH_MIN_AMOUNT) / np.log(SKETCH_GAMMA))) + 1
+
+
+def amount_bins(amounts):
+    """Sketch bin of each amount (NaN and non-positive amounts go to bin 0)."""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bins = np.floor(np.log(amounts / SKETCH_MIN_AMOUNT) / np.log(SKETCH_GAMMA)) + 1
+    return np.clip(np.nan_to_num(bins, nan=0, neginf=0), 0, SKETCH_BINS - 1).astype(np.int16)
+
+
+def bin_values(bins):
+    """Representative amount of each bin (geometric middle, 0 for bin 0)."""
+    bins = np.asarray(bins)
+    return np.where(bins > 0, SKETCH_MIN_AMOUNT * SKETCH_GAMMA ** (bins - 0.5), 0.0)
+
+
+def customer_key(card, category):
+    """
+    Lookup key of a (card, category) profile: the card's integer digits. A
+    float card only matches when it is exact (below 2**53), so card columns
+    are read as integers (the domain's "dtypes"), never as floats.
+    """
+    if isinstance(card, (float, np.floating)) and float(card).is_integer() and abs(card) < FLOAT_EXACT:
+        card = int(card)
+    return f"{card}|{category}"
+
+
+class AmountSketch:
+    """
+    Mergeable amount histogram per group (e.g. category, or card + category).
+    Counts live in a sparse Series indexed by (*group, bin), so sketches of
+    different chunks or files merge by adding counts, in any order.
+    """
+
+    def __init__(self, by):
+        import pandas as pd
+        self.by = list(by)
+        self.counts = pd.Series(dtype=np.int64)
+
+    def add(self, df, amount_col):
+        import pandas as pd
+        # Plain arrays: categorical columns would otherwise count every unobserved combination
+        frame = pd.DataFrame({col: np.asarray(df[col]) for col in self.by})
+        frame['bin'] = amount_bins(df[amount_col])
+        return self.merge_counts(frame.value_counts(sort=False))
+
+    def merge(self, other):
+        return self.merge_counts(other.counts)
+
+    def merge_counts(self, counts):
+        if len(self.counts):
+            counts = self.counts.add(counts, fill_value=0)
+        self.counts = counts.astype(np.int64)
+        return self
+
+    def quantiles(self, q, min_count=1):
+        """Nearest-rank q-quantile of each group with at least min_count amounts."""
+        import pandas as pd
+        if not len(self.counts):
+            return pd.Series(dtype=np.float64)
+        counts = self.counts.sort_index()
+        groups = counts.groupby(level=list(range(len(self.by))))
+        total = groups.transform('sum')
+        reached = groups.cumsum() >= np.ceil(q * total)
+        first = counts[reached & (total >= min_count)].groupby(level=list(range(len(self.by)))).head(1)
+        return pd.Series(bin_values(first.index.get_level_values('bin')), index=first.index.droplevel('bin'))
+
+    def overall(self, q):
+        """q-quantile over every group together."""
+        counts = self.counts.groupby(level='bin').sum().sort_index()
+        if not len(counts):
+            return None
+        cum = counts.cumsum().to_numpy()
+        return float(bin_values(counts.index[np.searchsorted(cum, np.ceil(q * cum[-1]))]))
+
+
+def build_sketches(chunks, config):
+    """One streaming pass: category and card + category sketches of legitimate amounts."""
+    from src.ingest import positive_mask
+    spec = config['profile']
+    category = AmountSketch([spec['category']])
+    customer = AmountSketch([spec['key'], spec['category']])
+    for chunk in chunks:
+        if config['target'] in chunk.columns:
+            chunk = chunk[~positive_mask(chunk[config['target']])]  # profile normal spending only
+        chunk = chunk.dropna(subset=[spec['category']])
+        category.add(chunk, spec['amount'])
+        if spec['key'] in chunk.columns:
+            customer.add(chunk.dropna(subset=[spec['key']]), spec['amount'])
+    return {"category": category, "customer": customer, "sources": []}
+
+
+def _load_sketches(path, config):
+    import joblib
+    stored = joblib.load(path)
+    spec = config['profile']
+    category = AmountSketch([spec['category']]).merge_counts(stored['category'])
+    customer = AmountSketch([spec['key'], spec['category']]).merge_counts(stored['customer'])
+    return {"category": category, "customer": customer, "sources": stored['sources']}
+
+
+def lookup_table(sketches, q=THRESHOLD_QUANTILE, min_history=MIN_CUSTOMER_HISTORY):
+    """Flattens the sketches into the JSON lookup table the engine loads."""
+    category = sketches['category'].quantiles(q)
+    customer = sketches['customer'].quantiles(q, min_count=min_history)
+    return {
+        "version": PROFILE_VERSION,
+        "quantile": q,
+        "created": time.time(),
+        "sources": sketches['sources'],
+        "default_threshold": sketches['category'].overall(q),
+        "category_thresholds": {str(cat): round(v, 2) for cat, v in category.items()},
+        "customer_thresholds": {customer_key(card, cat): round(v, 2) for (card, cat), v in customer.items()},
+    }
+
+
+def refresh(source, domain="Credit Card", rebuild=False, folder=PROFILE_DIR):
+    """
+    Adds a dataset to the stored sketches (a file already included is
+    skipped) and rewrites the lookup table. Returns the table.
+    """
+    import joblib
+    from src.storage import iter_dataset, file_fingerprint
+    config = DOMAIN_CONFIG[domain]
+    sketch_path = os.path.join(folder, PROFILE_SKETCH)
+    sketches = None if rebuild or not os.path.exists(sketch_path) else _load_sketches(sketch_path, config)
+
+    fingerprint = file_fingerprint(source)
+    if sketches is None or fingerprint not in sketches['sources']:
+        update = build_sketches(iter_dataset(source, config), config)
+        if sketches is None:
+            sketches = update
+        else:
+            sketches['category'].merge(update['category'])
+            sketches['customer'].merge(update['customer'])
+        sketches['sources'].append(fingerprint)
+
+    os.makedirs(folder, exist_ok=True)
+    # Only plain counts are stored, so the file doesn't depend on where this module was run from
+    joblib.dump({
+        "category": sketches['category'].counts,
+        "customer": sketches['customer'].counts,
+        "sources": sketches['sources'],
+    }, sketch_path)
+    table = lookup_table(sketches)
+    table_path = os.path.join(folder, PROFILE_TABLE)
+    with open(table_path + '.tmp', 'w') as f:
+        json.dump(table, f)
+    os.replace(table_path + '.tmp', table_path)
+    return table
+
+
+def load_context(folder=PROFILE_DIR):
+    """Engine context from the stored lookup table ({} when no profile was built yet)."""
+    try:
+        with open(os.path.join(folder, PROFILE_TABLE)) as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if table.get('version') != PROFILE_VERSION:
+        return {}
+    context = {
+        "category_thresholds": table['category_thresholds'],
+        "customer_thresholds": table['customer_thresholds'],
+    }
+    if table.get('default_threshold') is not None:
+        context['default_threshold'] = table['default_threshold']
+    return context
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learn per-category amount thresholds for the rule engine.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("refresh", help="add a dataset to the profiles and rewrite the lookup table")
+    cmd.add_argument("source", nargs="?", default="data/raw/creditcard.csv")
+    cmd.add_argument("--rebuild", action="store_true", help="start from empty sketches")
+    args = parser.parse_args()
+
+    table = refresh(args.source, rebuild=args.rebuild)
+    print(f"{len(table['category_thresholds'])} categories, "
+          f"{len(table['customer_thresholds'])} card profiles, "
+          f"default {table['default_threshold']} -> {os.path.join(PROFILE_DIR, PROFILE_TABLE)}")
@@ -0,0 +1,378 @@
+# src/rules.py
+import numpy as np
+from src.geo import haversine
+from src.profiles import customer_key
+
+SCORE_CAP = 100
+
+# Fallback thresholds based on category, used until learned profiles exist
+# (python -m src.profiles refresh writes per-category and per-card ones)
+CATEGORY_THRESHOLDS = {'grocery': 200, 'travel': 3000, 'tech': 1500}
+DEFAULT_CATEGORY_THRESHOLD = 500
+
+# Velocity limits (see src/velocity.py): card transactions per hour, and the
+# speed between consecutive transactions no traveller can reach (airliner)
+BURST_TXNS_1H = 5
+MAX_TRAVEL_KMH = 900
+
+# Mule limits (see src/graph.py): money moved on within this many steps
+# (hours) of arriving, and destinations collecting from many senders that
+# pass most of it straight through
+CASH_OUT_STEPS = 1
+MULE_FAN_IN = 5
+MULE_PASS_THROUGH = 0.9
+
+
+class Rule:
+    """One weighted check of a domain pathway."""
+
+    def __init__(self, name, weight, predicate, message, inputs):
+        self.name = name
+        self.weight = weight
+        self.predicate = predicate  # c -> bool, written with NumPy ops so it also works on arrays
+        self.message = message      # str.format template over inputs and derived values
+        self.inputs = tuple(inputs)
+
+
+class Derived:
+    """
+    An intermediate value (ratio, distance, limit...) shared by several rules.
+    func(c, context) works on one transaction; vector_func, when given, is the
+    column-wise version used for DataFrames. optional lists the columns it
+    reads only when present (c.get), which never gate the rules using it.
+    """
+
+    def __init__(self, name, func, inputs, vector_func=None, optional=()):
+        self.name = name
+        self.func = func
+        self.vector_func = vector_func or func
+        self.inputs = tuple(inputs)
+        self.optional = tuple(optional)
+
+
+class RuleRegistry:
+    """
+    Declarative store of rules per domain.
+    Rules are registered once at import time and compiled into a RulePlan
+    per domain, so scoring never rebuilds tables or re-checks the domain.
+    """
+
+    def __init__(self):
+        self.decision_types = {}
+        self.rules = {}
+        self.derived = {}
+
+    @property
+    def domains(self):
+        return list(self.decision_types)
+
+    def add_domain(self, domain, decision_type):
+        self.decision_types[domain] = decision_type
+        self.rules.setdefault(domain, [])
+        self.derived.setdefault(domain, {})
+
+    def derive(self, domain, name, func, inputs=(), vector_func=None, optional=()):
+        self.derived[domain][name] = Derived(name, func, inputs, vector_func, optional)
+
+    def add(self, domain, name, weight, predicate, message, inputs):
+        self.rules[domain].append(Rule(name, weight, predicate, message, inputs))
+
+    def factor_bits(self, domain):
+        # Bits follow registration order, so masks stay stable as rules are added
+        return {rule.name: bit for bit, rule in enumerate(self.rules.get(domain, []))}
+
+    def compile(self, domain, context=None):
+        return RulePlan(
+            domain,
+            self.decision_types[domain],
+            self.rules[domain],
+            self.derived[domain],
+            context or {},
+        )
+
+
+class RulePlan:
+    """
+    Flat evaluation plan for one domain.
+    Each rule carries the raw columns it needs (derived inputs resolved), so a
+    rule is skipped outright when any of them is missing from the input.
+    """
+
+    def __init__(self, domain, decision_type, rules, derived, context):
+        self.domain = domain
+        self.decision_type = decision_type
+        self.derived = derived
+        self.context = context
+
+        self.derive_steps = [(d, self._requirements(d.inputs)) for d in derived.values()]
+        bits = {rule.name: bit for bit, rule in enumerate(rules)}
+        # Heaviest rules first, so short-circuiting at the cap happens as early as possible
+        ordered = sorted(rules, key=lambda r: -r.weight)
+        self.steps = [(r, bits[r.name], self._requirements(r.inputs)) for r in ordered]
+
+        # Every raw column some rule reads (derived inputs resolved, optional ones included)
+        self.columns = frozenset().union(
+            *(required for _, _, required in self.steps), *(d.optional for d in derived.values()))
+
+        n = len(rules)
+        self.mask_dtype = np.uint8 if n <= 8 else np.uint16 if n <= 16 else np.uint32 if n <= 32 else np.uint64
+
+    def _requirements(self, names):
+        required = set()
+        for name in names:
+            if name in self.derived:
+                required |= self._requirements(self.derived[name].inputs)
+            else:
+                required.add(name)
+        return frozenset(required)
+
+    def evaluate(self, inputs: dict, short_circuit=False):
+        """Scores one transaction dict. Returns (score, factors)."""
+        keys = inputs.keys()
+        c = dict(inputs)
+        for derived, required in self.derive_steps:
+            if required <= keys:
+                c[derived.name] = derived.func(c, self.context)
+
+        score = 0
+        factors = {}
+        for rule, _, required in self.steps:
+            if short_circuit and score >= SCORE_CAP:
+                break
+            if not required <= keys:
+                continue
+            if rule.predicate(c):
+                score += rule.weight
+                factors[rule.name] = rule.message.format_map(_RenderContext(c))
+        return min(score, SCORE_CAP), factors
+
+    def evaluate_batch(self, df, short_circuit=False):
+        """Scores a whole DataFrame. Returns (score, factor mask) arrays."""
+        n = len(df)
+        score = np.zeros(n, dtype=np.int16)
+        mask = np.zeros(n, dtype=self.mask_dtype)
+        c = _BatchColumns(df, self.derived, self.context)
+        rows = None  # None means every row is still open
+        columns = set(df.columns)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for rule, bit, required in self.steps:
+                if not required <= columns:
+                    continue
+                hit = np.broadcast_to(np.asarray(rule.predicate(c), dtype=bool), (c.n,))
+                if rows is None:
+                    np.add(score, np.multiply(hit, rule.weight, dtype=np.int16), out=score)
+                    np.bitwise_or(mask, np.left_shift(hit, bit, dtype=self.mask_dtype), out=mask)
+                else:
+                    score[rows] += np.multiply(hit, rule.weight, dtype=np.int16)
+                    mask[rows] |= np.left_shift(hit, bit, dtype=self.mask_dtype)
+
+                if short_circuit:
+                    # Rows at the cap cannot change action; evaluate the rest on open rows only
+                    capped = score >= SCORE_CAP if rows is None else score[rows] >= SCORE_CAP
+                    if capped.any():
+                        keep = np.flatnonzero(~capped)
+                        rows = keep if rows is None else rows[keep]
+                        if len(rows) == 0:
+                            break
+                        c = c.take(keep)
+
+        np.minimum(score, SCORE_CAP, out=score)
+        return score, mask
+
+
+class _BatchColumns:
+    """Column view over a DataFrame: numeric float64 arrays, derived values cached."""
+
+    def __init__(self, df, derived, context, rows=None):
+        self.df = df
+        self.derived = derived
+        self.context = context
+        self.rows = rows
+        self.n = len(df) if rows is None else len(rows)
+        self.cache = {}
+
+    def __getitem__(self, name):
+        if name not in self.cache:
+            if name in self.derived:
+                self.cache[name] = self.derived[name].vector_func(self, self.context)
+            else:
+                import pandas as pd  # batch callers pass a DataFrame, so it is loaded already
+                values = pd.to_numeric(self.raw(name), errors='coerce')
+                self.cache[name] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        return self.cache[name]
+
+    def raw(self, name):
+        col = self.df[name]
+        return col if self.rows is None else col.iloc[self.rows]
+
+    def get(self, name, default=None):
+        return self.raw(name) if name in self.df.columns else default
+
+    def take(self, keep):
+        rows = keep if self.rows is None else self.rows[keep]
+        sub = _BatchColumns(self.df, self.derived, self.context, rows)
+        sub.cache = {k: v[keep] for k, v in self.cache.items()}
+        return sub
+
+
+class _RenderContext(dict):
+    """Template lookup for factor messages; optional inputs render as 'unknown'."""
+
+    def __missing__(self, name):
+        return 'unknown'
+
+
+# --- DERIVED VALUES ---
+
+def _payment_ratio(c, context):
+    amt_credit = c['AMT_CREDIT']
+    return c['AMT_ANNUITY'] / amt_credit if amt_credit > 0 else 0
+
+
+def _payment_ratio_batch(c, context):
+    amt_credit = c['AMT_CREDIT']
+    return np.divide(c['AMT_ANNUITY'], amt_credit, out=np.zeros(c.n), where=amt_credit > 0)
+
+
+def _distance(c, context):
+    return haversine(c['lat'], c['long'], c['merch_lat'], c['merch_long'])
+
+
+def _distance_batch(c, context):
+    # Float64 so rows right at the 100km / 800km cutoffs agree with the scalar path
+    return haversine(c['lat'], c['long'], c['merch_lat'], c['merch_long'], dtype=np.float64)
+
+
+def _amount_limit(c, context):
+    limits = context.get('category_thresholds', CATEGORY_THRESHOLDS)
+    default = context.get('default_threshold', DEFAULT_CATEGORY_THRESHOLD)
+    category = c.get('category', 'unknown')
+    customers = context.get('customer_thresholds')
+    if customers and 'cc_num' in c:
+        # The card's own habit in this category, when it has enough history
+        limit = customers.get(customer_key(c['cc_num'], category))
+        if limit is not None:
+            return limit
+    return limits.get(category, default)
+
+
+def _amount_limit_batch(c, context):
+    limits = context.get('category_thresholds', CATEGORY_THRESHOLDS)
+    default = context.get('default_threshold', DEFAULT_CATEGORY_THRESHOLD)
+    category = c.get('category')
+    if category is None:
+        return np.full(c.n, default, dtype=np.float64)
+    # Look up each distinct category once, then broadcast by code
+    # (NaN gets code -1, which lands on the trailing default)
+    import pandas as pd
+    codes, uniques = pd.factorize(category)
+    table = np.array([limits.get(u, default) for u in uniques] + [default], dtype=np.float64)
+    limit = table[codes]
+
+    customers = context.get('customer_thresholds')
+    card = c.get('cc_num')
+    if customers and card is not None:
+        # Same idea for (card, category) pairs; pairs without a profile keep the category limit.
+        # Cards are factorized on their own, since a MultiIndex (or np.asarray) turns
+        # nullable card numbers into floats, which 19-digit cards don't survive
+        card_codes, cards = pd.factorize(card)
+        width = len(uniques)
+        pairs = np.where((card_codes >= 0) & (codes >= 0), card_codes.astype(np.int64) * width + codes, -1)
+        pair_codes, pairs = pd.factorize(pairs)
+        cards, categories = list(cards), list(uniques)
+        found = np.array([customers.get(customer_key(cards[p // width], categories[p % width]), np.nan)
+                          if p >= 0 else np.nan for p in pairs] + [np.nan])
+        own = found[pair_codes]
+        limit = np.where(np.isnan(own), limit, own)
+    return limit
+
+
+def _hop_speed(c, context):
+    secs, dist = c['secs_since_last'], c['dist_from_prev_km']
+    return dist * 3600 / secs if secs > 0 and dist > 0 else 0
+
+
+def _hop_speed_batch(c, context):
+    secs, dist = c['secs_since_last'], c['dist_from_prev_km']
+    return np.divide(dist * 3600, secs, out=np.zeros(c.n), where=(secs > 0) & (dist > 0))
+
+
+# --- DEFAULT PATHWAYS ---
+
+RULES = RuleRegistry()
+
+# PATHWAY 1: LOAN APPLICATION (Creditworthiness & Consistency)
+RULES.add_domain("Loan Application", "Rejection Probability")
+RULES.derive("Loan Application", "payment_ratio", _payment_ratio, inputs=("AMT_CREDIT", "AMT_ANNUITY"), vector_func=_payment_ratio_batch)
+RULES.add(
+    "Loan Application", "High Payment Burden", weight=30,
+    predicate=lambda c: c['payment_ratio'] > 0.15,  # High interest/payment burden
+    message="Payment is {payment_ratio:.1%} of loan", inputs=("payment_ratio",),
+)
+RULES.add(
+    "Loan Application", "Over-Financing", weight=30,
+    predicate=lambda c: c['AMT_CREDIT'] > c['AMT_GOODS_PRICE'] * 1.2,
+    message="Loan > 120% of Goods Value", inputs=("AMT_CREDIT", "AMT_GOODS_PRICE"),
+)
+RULES.add(
+    "Loan Application", "Rapid Re-application", weight=25,
+    predicate=lambda c: (c['DAYS_DECISION'] > -5) & (c['DAYS_DECISION'] < 0),
+    message="Applied within last 5 days", inputs=("DAYS_DECISION",),
+)
+
+# PATHWAY 2: CREDIT CARD (Spatial & Contextual)
+RULES.add_domain("Credit Card", "Fraud Probability")
+RULES.derive("Credit Card", "dist", _distance, inputs=("lat", "long", "merch_lat", "merch_long"), vector_func=_distance_batch)
+RULES.derive("Credit Card", "amount_limit", _amount_limit, vector_func=_amount_limit_batch,
+             optional=("category", "cc_num"))
+RULES.add(
+    "Credit Card", "Impossible Travel", weight=50,
+    predicate=lambda c: c['dist'] > 800,
+    message="Merchant is {dist:.0f}km away", inputs=("dist",),
+)
+RULES.add(
+    "Credit Card", "Unusual Distance", weight=20,
+    predicate=lambda c: (c['dist'] > 100) & (c['dist'] <= 800),
+    message="Merchant is {dist:.0f}km away", inputs=("dist",),
+)
+RULES.add(
+    "Credit Card", "Amount Spikes", weight=30,
+    predicate=lambda c: c['amt'] > c['amount_limit'],
+    message="${amt} exceeds usual {category} spend", inputs=("amt", "amount_limit"),
+)
+RULES.derive("Credit Card", "hop_speed", _hop_speed, inputs=("secs_since_last", "dist_from_prev_km"), vector_func=_hop_speed_batch)
+RULES.add(
+    "Credit Card", "Card Burst", weight=25,
+    predicate=lambda c: c['txn_count_1h'] >= BURST_TXNS_1H,
+    message="{txn_count_1h:.0f} earlier transactions in the last hour", inputs=("txn_count_1h",),
+)
+RULES.add(
+    "Credit Card", "Implausible Hop", weight=40,
+    predicate=lambda c: c['hop_speed'] > MAX_TRAVEL_KMH,
+    message="{dist_from_prev_km:.0f}km from the previous transaction in {secs_since_last:.0f}s", inputs=("hop_speed",),
+)
+
+# PATHWAY 3: MOBILE (Account Integrity)
+RULES.add_domain("Mobile Transaction", "Account Compromise Risk")
+RULES.add(
+    "Mobile Transaction", "Wallet Drain", weight=60,
+    predicate=lambda c: (c['oldbalanceOrg'] > 0) & (c['newbalanceOrig'] == 0),
+    message="Account completely emptied", inputs=("oldbalanceOrg", "newbalanceOrig"),
+)
+RULES.add(
+    "Mobile Transaction", "Balance Mismatch", weight=40,  # Backend Manipulation
+    predicate=lambda c: abs(c['oldbalanceOrg'] - c['amount'] - c['newbalanceOrig']) > 1.0,
+    message="Server-side math error detected", inputs=("oldbalanceOrg", "amount", "newbalanceOrig"),
+)
+RULES.add(
+    "Mobile Transaction", "Rapid Cash-Out", weight=30,
+    predicate=lambda c: (c['orig_cash_out_steps'] >= 0) & (c['orig_cash_out_steps'] <= CASH_OUT_STEPS),
+    message="Funds moved on {orig_cash_out_steps:.0f}h after arriving", inputs=("orig_cash_out_steps",),
+)
+RULES.add(
+    "Mobile Transaction", "Mule Destination", weight=40,
+    predicate=lambda c: (c['dest_fan_in'] >= MULE_FAN_IN) & (c['dest_pass_through'] >= MULE_PASS_THROUGH),
+    message="Recipient collected {dest_fan_in:.0f} transfers and passed on {dest_pass_through:.0%}",
+    inputs=("dest_fan_in", "dest_pass_through"),
+)
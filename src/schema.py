@@ -1,7 +1,14 @@
 # src/schema.py
 
+# Raw target values that count as the positive (fraud / rejected) class
+POSITIVE_LABELS = ['1', '1.0', 'Yes', 'True', 'Refused', 'Fraud', 'TARGET']
+
+# Numerical features are read as float32 unless they set their own "dtype"
+# (balances need float64 so the engine's 1.0 balance-mismatch tolerance holds)
+
 DOMAIN_CONFIG = {
     "Credit Card": {
+        "domain": "Credit Card",  # its own key, for code handed only the config (e.g. the CSV validator)
         "target": "is_fraud",
         "drop_cols": ["trans_date_trans_time", "cc_num", "unix_time", "trans_num"],
         "features": {
@@ -12,13 +19,28 @@ DOMAIN_CONFIG = {
                 "long": {"min": -125.0, "max": -65.0, "step": 0.1},
                 "city_pop": {"min": 1000.0, "max": 1000000.0, "step": 1000.0},
                 "merch_lat": {"min": 20.0, "max": 50.0, "step": 0.1},
-                "merch_long": {"min": -125.0, "max": -65.0, "step": 0.1}
+                "merch_long": {"min": -125.0, "max": -65.0, "step": 0.1},
+                # Velocity: computed per card by src/velocity.py (-1 = no previous transaction)
+                "txn_count_1h": {"min": 0.0, "max": 20.0, "step": 1.0},
+                "amt_sum_1h": {"min": 0.0, "max": 10000.0, "step": 50.0},
+                "txn_count_24h": {"min": 0.0, "max": 100.0, "step": 1.0},
+                "amt_sum_24h": {"min": 0.0, "max": 20000.0, "step": 50.0},
+                "secs_since_last": {"min": -1.0, "max": 604800.0, "step": 60.0},
+                "dist_from_prev_km": {"min": -1.0, "max": 5000.0, "step": 10.0}
             },
             "categorical": ["category", "gender", "job"], 
             "flags": [] 
-        }
+        },
+        # Raw columns the velocity features are built from (kept out of the model via drop_cols)
+        "velocity": {"key": "cc_num", "time": "unix_time", "amount": "amt", "lat": "merch_lat", "long": "merch_long"},
+        # Columns the learned amount profiles are built from (see src/profiles.py)
+        "profile": {"key": "cc_num", "category": "category", "amount": "amt"},
+        # read_csv dtypes of other columns: card numbers as exact (nullable) integers,
+        # since 19-digit cards don't survive a float64 read
+        "dtypes": {"cc_num": "Int64"}
     },
     "Loan Application": {
+        "domain": "Loan Application",
         "target": "NAME_CONTRACT_STATUS",
         "drop_cols": ["SK_ID_CURR", "SK_ID_PREV"], # ID columns confuse models
         "features": {
@@ -34,20 +56,28 @@ DOMAIN_CONFIG = {
         }
     },
     "Mobile Transaction": {
+        "domain": "Mobile Transaction",
         "target": "isFraud",
         # STRICTLY DROP 'isFlaggedFraud' -> It is a target leak!
         "drop_cols": ["nameOrig", "nameDest", "isFlaggedFraud"], 
         "features": {
             "numerical": {
-                "amount": {"min": 0.0, "max": 1000000.0, "step": 1000.0},
-                "oldbalanceOrg": {"min": 0.0, "max": 1000000.0, "step": 1000.0},
-                "newbalanceOrig": {"min": 0.0, "max": 1000000.0, "step": 1000.0},
-                "oldbalanceDest": {"min": 0.0, "max": 1000000.0, "step": 1000.0},
-                "newbalanceDest": {"min": 0.0, "max": 1000000.0, "step": 1000.0},
-                "step": {"min": 1.0, "max": 744.0, "step": 1.0} # Time steps
+                "amount": {"min": 0.0, "max": 1000000.0, "step": 1000.0, "dtype": "float64"},
+                "oldbalanceOrg": {"min": 0.0, "max": 1000000.0, "step": 1000.0, "dtype": "float64"},
+                "newbalanceOrig": {"min": 0.0, "max": 1000000.0, "step": 1000.0, "dtype": "float64"},
+                "oldbalanceDest": {"min": 0.0, "max": 1000000.0, "step": 1000.0, "dtype": "float64"},
+                "newbalanceDest": {"min": 0.0, "max": 1000000.0, "step": 1000.0, "dtype": "float64"},
+                "step": {"min": 1.0, "max": 744.0, "step": 1.0}, # Time steps
+                # Account graph: computed by src/graph.py (-1 = account never received money)
+                "dest_fan_in": {"min": 0.0, "max": 100.0, "step": 1.0},
+                "dest_pass_through": {"min": 0.0, "max": 2.0, "step": 0.05},
+                "dest_cash_out_steps": {"min": -1.0, "max": 744.0, "step": 1.0},
+                "orig_cash_out_steps": {"min": -1.0, "max": 744.0, "step": 1.0}
             },
             "categorical": ["type"],
             "flags": []
-        }
+        },
+        # Transfer edges of the account graph (names stay out of the model via drop_cols)
+        "graph": {"orig": "nameOrig", "dest": "nameDest", "amount": "amount", "time": "step"}
     }
 }
\ No newline at end of file
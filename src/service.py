@@ -0,0 +1,327 @@
+# src/service.py
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from src.schema import DOMAIN_CONFIG
+from src.engine import decode_factors
+from src.hybrid import HybridScorer
+from src.model_store import find_latest, load_model
+from src.velocity import VelocityStore
+from src.graph import AccountGraph, GRAPH_TTL
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Micro-batching: a batch is scored once it holds MAX_BATCH transactions or
+# its first request has waited MAX_WAIT_MS, whichever comes first
+MAX_BATCH = 256
+MAX_WAIT_MS = 5.0
+# Request latencies kept for the percentile counters
+LATENCY_WINDOW = 10_000
+
+
+class ServiceMetrics:
+    """Throughput and latency counters exposed on /metrics."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.transactions = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # seconds per request
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self):
+        uptime = time.time() - self.started
+        lat = np.array(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (0.0, 0.0, 0.0)
+        return {
+            "uptime_s": round(uptime, 1),
+            "requests": self.requests,
+            "transactions": self.transactions,
+            "batches": self.batches,
+            "errors": self.errors,
+            "throughput_tps": round(self.transactions / uptime, 1) if uptime else 0.0,
+            "avg_batch_size": round(float(np.mean(self.batch_sizes)), 1) if self.batch_sizes else 0.0,
+            "latency_ms": {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2)},
+        }
+
+
+class _Pending:
+    __slots__ = ("records", "future", "received")
+
+    def __init__(self, records, future):
+        self.records = records
+        self.future = future
+        self.received = time.perf_counter()
+
+
+class ScoringService:
+    """
+    Scores transactions with a persisted FraudModel plus the rule engine
+    (one HybridScorer pass: rule-blocked rows skip the model). Concurrent requests are queued and grouped into micro-batches (see
+    MAX_BATCH / MAX_WAIT_MS), so the model and the engine each run one
+    vectorized call per batch. Batches are scored one at a time on a worker
+    thread, which also keeps the velocity / account-graph state in arrival order.
+    Records are validated one by one: a bad record gets its own error result
+    and never reaches the stateful features, and the rest of the batch scores.
+    """
+
+    def __init__(self, model, domain, engine=None, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.domain = domain
+        self.config = DOMAIN_CONFIG[domain]
+        self.scorer = HybridScorer(model, domain, engine)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = ServiceMetrics()
+        # Stateful features are filled in when requests carry the raw columns
+        self.velocity = VelocityStore() if 'velocity' in self.config else None
+        self.graph = AccountGraph(ttl=GRAPH_TTL) if 'graph' in self.config else None
+        self._queue = None
+        self._worker = ThreadPoolExecutor(max_workers=1)
+
+        # Fields validate() coerces: numbers (features and the raw columns of
+        # the stateful features), and labels (categoricals and account keys)
+        features = self.config['features']
+        velocity, graph = self.config.get('velocity', {}), self.config.get('graph', {})
+        self._numeric = set(features['numerical']) | set(features['flags']) | {
+            velocity.get(k) for k in ("time", "amount", "lat", "long")} | {graph.get(k) for k in ("amount", "time")}
+        self._labels = set(features['categorical']) | {velocity.get('key'), graph.get('orig'), graph.get('dest')}
+        self._numeric.discard(None)
+        self._labels.discard(None)
+
+    # --- SCORING ---
+
+    def validate(self, record):
+        """
+        Coerces one transaction dict in place (numeric fields to float, NaN
+        when null). Returns an error message, or None when it can be scored.
+        """
+        for field in self._numeric & record.keys():
+            value = record[field]
+            if value is None:
+                record[field] = np.nan
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return f"field '{field}': expected a number, got {value!r}"
+            if value in (np.inf, -np.inf):
+                return f"field '{field}': expected a finite number"
+            record[field] = value
+        for field in self._labels & record.keys():
+            if not (record[field] is None or isinstance(record[field], (str, int, float))):
+                return f"field '{field}': expected a string or number, got {type(record[field]).__name__}"
+        return None
+
+    def _enrich(self, records):
+        spec = self.config.get('velocity')
+        if self.velocity is not None:
+            for r in records:
+                if all(_present(r.get(spec[k])) for k in ("key", "time", "amount")):
+                    r.update(self.velocity.update(
+                        r[spec['key']], r[spec['time']], r[spec['amount']],
+                        r.get(spec['lat'], np.nan), r.get(spec['long'], np.nan)))
+        spec = self.config.get('graph')
+        if self.graph is not None:
+            for r in records:
+                if all(_present(r.get(spec[k])) for k in ("orig", "dest", "amount", "time")):
+                    r.update(self.graph.update(r[spec['orig']], r[spec['dest']], r[spec['amount']], r[spec['time']]))
+
+    def score_records(self, records):
+        """
+        Scores a list of transaction dicts in one vectorized pass. Returns one
+        result dict each: the scores, or {"error": ...} for records that fail
+        validate() (those leave the velocity / graph state untouched).
+        """
+        errors = [self.validate(r) for r in records]
+        valid = [r for r, error in zip(records, errors) if error is None]
+        scored = self._score_valid(valid) if valid else []
+        if len(scored) != len(valid):
+            raise RuntimeError(f"scored {len(scored)} of {len(valid)} valid transactions")
+        scored = iter(scored)
+        return [{"error": error} if error else next(scored) for error in errors]
+
+    def _score_valid(self, records):
+        self._enrich(records)
+        # One row per record even when none carries a field ([{}] alone would give a 0-row frame);
+        # missing fields score like nulls
+        frame = pd.DataFrame.from_records(records, index=pd.RangeIndex(len(records)))
+        result = self.scorer.score_batch(frame)
+        return [
+            {
+                "probability": None if p != p else round(float(p), 4),  # None: blocked by the rules alone
+                "rule_score": int(s),
+                "factors": decode_factors(mask, self.domain),
+                "risk_score": int(r),
+                "action": a,
+            }
+            for p, s, mask, r, a in zip(result['probability'], result['rule_score'], result['factors'],
+                                        result['risk_score'], result['action'])
+        ]
+
+    async def score(self, records):
+        """Queues transactions for the next micro-batch and waits for their results."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(records, future))
+        return await future
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0].records)
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item.records)
+
+            records = [r for item in batch for r in item.records]
+            try:
+                results = await loop.run_in_executor(self._worker, self.score_records, records)
+            except Exception as e:
+                self.metrics.errors += len(batch)
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+
+            self.metrics.batches += 1
+            self.metrics.batch_sizes.append(size)
+            self.metrics.transactions += size
+            self.metrics.errors += sum("error" in r for r in results)
+            done = time.perf_counter()
+            offset = 0
+            for item in batch:
+                item.future.set_result(results[offset:offset + len(item.records)])
+                offset += len(item.records)
+                self.metrics.latencies.append(done - item.received)
+
+    # --- HTTP ---
+
+    async def _route(self, method, path, headers, body):
+        if method == "GET" and path == "/health":
+            return 200, "application/json", {"status": "ok", "domain": self.domain, "model": self.model.model_type}
+        if method == "GET" and path == "/metrics":
+            return 200, "application/json", self.metrics.snapshot()
+        if method != "POST" or path != "/score":
+            return 404, "application/json", {"error": f"no route for {method} {path}"}
+
+        self.metrics.requests += 1
+        ndjson = "ndjson" in headers.get("content-type", "")
+        try:
+            text = body.decode("utf-8")
+            if ndjson:
+                payload = [json.loads(line) for line in text.splitlines() if line.strip()]
+            else:
+                payload = json.loads(text)
+        except (UnicodeDecodeError, ValueError) as e:
+            self.metrics.errors += 1
+            return 400, "application/json", {"error": f"invalid body: {e}"}
+
+        single = isinstance(payload, dict)
+        records = [payload] if single else payload
+        if not records or not all(isinstance(r, dict) for r in records):
+            self.metrics.errors += 1
+            return 400, "application/json", {"error": "expected a transaction object or a list of them"}
+
+        try:
+            results = await self.score(records)
+        except Exception as e:
+            return 500, "application/json", {"error": str(e)}
+        if ndjson:
+            return 200, "application/x-ndjson", results
+        if single:
+            return (400 if "error" in results[0] else 200), "application/json", results[0]
+        return 200, "application/json", results
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, content_type, payload = await self._route(method, path.split("?")[0], headers, body)
+                if content_type == "application/x-ndjson":
+                    data = "".join(json.dumps(r) + "\n" for r in payload).encode()
+                else:
+                    data = json.dumps(payload).encode()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """Runs the HTTP server until cancelled. ready (an asyncio.Event) is set once it listens."""
+        self._queue = asyncio.Queue()
+        batcher = asyncio.create_task(self._batcher())
+        server = await asyncio.start_server(self._handle, host, port)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def _present(value):
+    return value is not None and value == value  # NaN != NaN
+
+
+def load_service(domain, model_path=None, **kwargs):
+    """Builds a service from a stored model (the newest one for the domain by default)."""
+    path = model_path or find_latest(domain)
+    model = load_model(path) if path else None
+    if model is None:
+        raise SystemExit(f"No compatible stored model for {domain}; train one in Model Analysis first.")
+    return ScoringService(model, domain, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP scoring service (POST /score, GET /metrics, GET /health).")
+    parser.add_argument("--domain", default="Credit Card", choices=list(DOMAIN_CONFIG))
+    parser.add_argument("--model", help="path of a stored .joblib model (default: newest for the domain)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    service = load_service(args.domain, args.model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    print(f"Scoring {args.domain} with {service.model.model_type} on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,192 @@
+# src/storage.py
+import os
+import json
+import hashlib
+import pandas as pd
+from src.ingest import iter_chunks, reader_args, concat_chunks, stratified_sample, domain_columns, CHUNK_ROWS
+from src.velocity import add_velocity, with_velocity
+from src.graph import add_graph, with_graph
+from src.instrumentation import timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet cache is optional; fall back to plain CSV parsing
+    pa = pq = None
+
+CACHE_DIR = "data/cache"
+FINGERPRINT_INDEX = "fingerprints.json"
+HASH_BLOCK = 1 << 20
+# Marker next to a cache path whose conversion failed
+FAILED_SUFFIX = ".failed"
+
+
+def file_fingerprint(source):
+    """
+    Content hash of a CSV path or uploaded buffer.
+    Hashes of files on disk are memoized on (size, mtime), so warm starts skip re-reading them.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if not isinstance(source, (str, os.PathLike)):
+        h.update(source.getbuffer() if hasattr(source, 'getbuffer') else source.read())
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return h.hexdigest()
+
+    path = os.path.abspath(source)
+    stat = os.stat(path)
+    index_path = os.path.join(CACHE_DIR, FINGERPRINT_INDEX)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    entry = index.get(path)
+    if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+        return entry['hash']
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            h.update(block)
+    index[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': h.hexdigest()}
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(index_path, 'w') as f:
+        json.dump(index, f)
+    return index[path]['hash']
+
+
+def frame_fingerprint(df):
+    """Cheap content hash of an in-memory frame (vectorized row hashes + schema)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def ensure_parquet(source, config, name=None):
+    """
+    Converts the domain columns of a CSV to a typed Parquet copy once,
+    keyed by its content hash and by how the domain reads it (columns,
+    dtypes, renames), so one file loaded under two domains gets two copies.
+    Returns the cache path, or None when pyarrow is missing or the file can't be converted.
+    A failed conversion leaves a marker, so later loads of the same content
+    go straight to CSV parsing instead of parsing the file twice.
+    """
+    if pq is None:
+        return None
+    name = name or os.path.basename(getattr(source, 'name', None) or str(source))
+    stem = os.path.splitext(name)[0]
+    args = reader_args(source, config)
+    read_hash = hashlib.blake2b(json.dumps(args, sort_keys=True, default=str).encode(), digest_size=6).hexdigest()
+    path = os.path.join(CACHE_DIR, f"{stem}-{file_fingerprint(source)}-{read_hash}.parquet")
+    failed_path = path + FAILED_SUFFIX
+    if os.path.exists(path):
+        return path
+    if os.path.exists(failed_path):
+        return None
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = path + '.tmp'
+    writer = None
+    try:
+        for chunk in iter_chunks(source, config, CHUNK_ROWS, args=args):
+            # Categories differ per chunk; store them as plain strings and re-dictionary on read
+            cat_cols = chunk.select_dtypes('category').columns
+            chunk = chunk.astype({c: object for c in cat_cols})
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            open(failed_path, 'w').close()
+            return None
+        writer.close()
+        os.replace(tmp_path, path)
+        return path
+    except (pa.ArrowException, ValueError):
+        # Column types drift mid-file (e.g. ints that gain NaNs); the CSV path still works
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        open(failed_path, 'w').close()
+        return None
+
+
+def _parquet_args(path, config):
+    schema = pq.read_schema(path)
+    cols = [c for c in domain_columns(config) if c in schema.names]
+    cats = [c for c in config['features']['categorical'] if c in cols]
+    return cols, cats
+
+
+def iter_parquet_chunks(path, config, batch_size=CHUNK_ROWS):
+    """Streams the domain columns of a cached Parquet file as DataFrame chunks."""
+    cols, cats = _parquet_args(path, config)
+    # No pre-buffering: it reads ahead across row groups, so memory would grow with the file
+    pf = pq.ParquetFile(path, read_dictionary=cats, pre_buffer=False)
+    offset = 0
+    for batch in pf.iter_batches(batch_size=batch_size, columns=cols):
+        chunk = batch.to_pandas()
+        # Keep file row numbers as the index, like chunked read_csv does
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+
+def _iter_from(path, source, config):
+    # path: ensure_parquet's result for source (None -> parse the CSV)
+    if path is None:
+        return iter_chunks(source, config)  # reader_args limits it to the domain columns
+    return iter_parquet_chunks(path, config)
+
+
+def iter_dataset(source, config, name=None):
+    """Streams the domain columns of a dataset as chunks, from the Parquet cache when possible."""
+    return _iter_from(ensure_parquet(source, config, name), source, config)
+
+
+def open_dataset(source, config, name=None):
+    """
+    (row count, chunk stream) of a dataset, resolving the Parquet cache once.
+    The count comes from the Parquet footer when cached, otherwise from
+    counting CSV lines in blocks (a quoted field spanning lines counts
+    twice, which only matters as an estimate).
+    """
+    path = ensure_parquet(source, config, name)
+    return _count_rows(path, source), _iter_from(path, source, config)
+
+
+def _count_rows(path, source):
+    if path is not None:
+        return pq.ParquetFile(path).metadata.num_rows
+    if not isinstance(source, (str, os.PathLike)):
+        data = bytes(source.getbuffer()) if hasattr(source, 'getbuffer') else source.read()
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return max(data.count(b'\n') + (not data.endswith(b'\n')) - 1, 0)
+    lines, last = 0, b'\n'
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    return max(lines + (last != b'\n') - 1, 0)
+
+
+@timed("data.load", memory=True)
+def load_dataset(source, config, sample_rows=None, name=None):
+    """
+    Loads a domain dataset through the Parquet cache, reading only the domain's columns.
+    Falls back to chunked CSV parsing when the cache isn't available.
+    Velocity and account-graph features are added on the full stream, before any sampling.
+    """
+    path = ensure_parquet(source, config, name)
+    if path is not None and not sample_rows:
+        cols, cats = _parquet_args(path, config)
+        df = pq.read_table(path, columns=cols, read_dictionary=cats).to_pandas()
+        return add_graph(add_velocity(df, config), config)
+
+    chunks = with_graph(with_velocity(_iter_from(path, source, config), config), config)
+    if sample_rows:
+        return stratified_sample(chunks, config['target'], sample_rows)
+    return concat_chunks(chunks)
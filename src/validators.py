@@ -1,7 +1,76 @@
 import re
+from functools import lru_cache
 import pandas as pd
 from abc import ABC, abstractmethod
 
+# Distinct header layouts whose column mapping is remembered per validator
+HEADER_CACHE_SIZE = 256
+
+
+def read_header(source):
+    """Column names of a CSV (path or uploaded buffer) without parsing any rows."""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    columns = pd.read_csv(source, nrows=0).columns.tolist()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return columns
+
+
+def _match_score(regex, internal, col):
+    """
+    How well a matching column name fits an internal field: exact name
+    first, then a pattern matching the whole name, then the share of the
+    name covered by the longest match (ties: leftmost column).
+    """
+    if col.lower() == internal.lower():
+        return (3, 1.0)
+    if regex.fullmatch(col):
+        return (2, 1.0)
+    longest = max((m.end() - m.start() for m in regex.finditer(col)), default=0)
+    return (1, longest / len(col))
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _detect(validator_cls, header):
+    patterns = validator_cls.compiled_patterns()
+    candidates = []
+    for internal, regex in patterns.items():
+        search = regex.search
+        # Cheap C-level filter first; only matching columns are scored
+        for position in [i for i, col in enumerate(header) if search(col) or col.lower() == internal.lower()]:
+            col = header[position]
+            candidates.append((_match_score(regex, internal, col), -position, internal, col))
+
+    # Best-scored pairs first; every internal field and every column is used once
+    mapping = {}
+    taken = set()
+    for _, _, internal, col in sorted(candidates, reverse=True):
+        if internal not in mapping and col not in taken:
+            mapping[internal] = col
+            taken.add(col)
+    return tuple((internal, mapping[internal]) for internal in patterns if internal in mapping)
+
+
+def schema_renames(header, wanted, domain):
+    """
+    {file column: domain column} for domain columns (wanted) missing from a
+    CSV header that the domain's validator finds under another name, e.g. an
+    'amount' column for 'amt'. Columns already named like a domain column
+    are kept; domains without a validator get no renames.
+    """
+    validator_cls = VALIDATORS.get(domain)
+    if validator_cls is None:
+        return {}
+    present = set(header)
+    renames = {}
+    for internal, col in _detect(validator_cls, tuple(header)):
+        if (internal in wanted and internal not in present and col not in wanted
+                and col not in renames and internal not in renames.values()):
+            renames[col] = internal
+    return renames
+
+
 class BaseValidator(ABC):
     @property
     @abstractmethod
@@ -11,25 +80,28 @@ class BaseValidator(ABC):
     @abstractmethod
     def column_patterns(self): pass
 
+    @classmethod
+    def compiled_patterns(cls):
+        """column_patterns compiled once per validator class."""
+        if '_compiled' not in cls.__dict__:
+            cls._compiled = {k: re.compile(p, re.IGNORECASE) for k, p in cls.column_patterns.items()}
+        return cls._compiled
+
+    def detect(self, columns):
+        """
+        Maps internal fields to columns from the header alone: {internal: column}.
+        Conflicts (two fields wanting one column) go to the best-scored match,
+        and mappings are cached per header signature.
+        """
+        return dict(_detect(type(self), tuple(str(c) for c in columns)))
+
     def normalize(self, df: pd.DataFrame):
         """Finds columns via Regex and renames them to internal standard."""
-        df_cols = df.columns.tolist()
-        rename_map = {}
-        found_internal_cols = []
-
-        for internal, pattern in self.column_patterns.items():
-            for col in df_cols:
-                if re.search(pattern, col, re.IGNORECASE):
-                    rename_map[col] = internal
-                    found_internal_cols.append(internal)
-                    break
-        
-        # Rename and keep only relevant columns
-        clean_df = df.rename(columns=rename_map)
-        # Filter to keep only mapped columns to avoid noise
-        final_df = clean_df[list(rename_map.values())]
-        
-        return final_df, found_internal_cols
+        mapping = self.detect(df.columns)
+        # Subset first, then relabel: only the mapped columns are ever copied
+        final_df = df[list(mapping.values())]
+        final_df.columns = list(mapping)
+        return final_df, list(mapping)
 
     def check_capabilities(self, found_cols: list) -> list:
         """Returns a list of fraud detection types possible with these columns."""
@@ -47,7 +119,7 @@ class CreditCardValidator(BaseValidator):
         "merch_lat": r"merch.*lat",
         "merch_long": r"merch.*long",
         "time": r"time|date|trans_ts",
-        "category": r"cat|merchant_type"
+        "category": r"(^|_)cat|merchant_type"  # not 'location'
     }
 
     def check_capabilities(self, found_cols):
@@ -79,17 +151,21 @@ class MobileValidator(BaseValidator):
 
 class LoanValidator(BaseValidator):
     domain_name = "Loan Application"
+    # Internal fields carry the schema's column names, like the other validators
     column_patterns = {
-        "credit": r"amt_credit|loan_amt",
-        "annuity": r"amt_annuity|payment",
-        "goods_price": r"goods_price",
-        "days": r"days_decision"
+        "AMT_CREDIT": r"amt_credit|loan_amt",
+        "AMT_ANNUITY": r"amt_annuity|payment",
+        "AMT_GOODS_PRICE": r"goods_price",
+        "DAYS_DECISION": r"days_decision"
     }
 
     def check_capabilities(self, found_cols):
         caps = ["Credit Limit Analysis"]
-        if "credit" in found_cols and "annuity" in found_cols:
+        if "AMT_CREDIT" in found_cols and "AMT_ANNUITY" in found_cols:
             caps.append("Affordability Ratio Analysis")
-        if "goods_price" in found_cols:
+        if "AMT_GOODS_PRICE" in found_cols:
             caps.append("Over-financing Detection")
-        return caps
\ No newline at end of file
+        return caps
+
+# Validator of each domain, whose fields schema_renames() maps onto its columns
+VALIDATORS = {cls.domain_name: cls for cls in (CreditCardValidator, MobileValidator, LoanValidator)}
\ No newline at end of file
@@ -0,0 +1,179 @@
+# src/velocity.py
+from collections import OrderedDict, deque
+import numpy as np
+import pandas as pd
+from src.geo import haversine
+
+# Rolling windows (seconds) keyed by the suffix of the features they produce
+VELOCITY_WINDOWS = {"1h": 3600, "24h": 86400}
+# Cards idle for longer than this are evicted and start a fresh history
+VELOCITY_TTL = 7 * 86400
+# Value of secs_since_last / dist_from_prev_km for a card's first transaction
+NO_HISTORY = -1.0
+
+
+def velocity_columns(windows=VELOCITY_WINDOWS):
+    """Names of the features produced by VelocityStore and backfill, in order."""
+    cols = []
+    for suffix in windows:
+        cols += [f"txn_count_{suffix}", f"amt_sum_{suffix}"]
+    return cols + ["secs_since_last", "dist_from_prev_km"]
+
+
+class _CardState:
+    __slots__ = ("last_ts", "last_lat", "last_long", "events", "cents")
+
+    def __init__(self, n_windows):
+        self.last_ts = None
+        self.last_lat = self.last_long = np.nan
+        self.events = [deque() for _ in range(n_windows)]  # (ts, cents) inside each window
+        self.cents = [0] * n_windows                         # running amount sum per window
+
+
+class VelocityStore:
+    """
+    Incremental velocity features keyed by card number.
+    Each event is scored against the card's history *before* it is added,
+    then appended. Window sums are kept in integer cents so they never
+    drift, every event enters and leaves each window once (O(1) amortized),
+    and cards idle for longer than ttl are evicted, which bounds memory to
+    the cards active in the last ttl seconds. Events are expected in time order.
+    """
+
+    def __init__(self, windows=VELOCITY_WINDOWS, ttl=VELOCITY_TTL):
+        if ttl < max(windows.values()):
+            raise ValueError("ttl must cover the longest velocity window")
+        self.windows = list(windows.items())
+        self.ttl = ttl
+        self.cards = OrderedDict()  # least recently seen card first
+
+    def __len__(self):
+        return len(self.cards)
+
+    def _evict(self, now):
+        while self.cards:
+            state = next(iter(self.cards.values()))
+            if state.last_ts >= now - self.ttl:
+                break
+            self.cards.popitem(last=False)
+
+    def update(self, card, ts, amount, lat=np.nan, long=np.nan):
+        """Records one transaction and returns its velocity features (see velocity_columns)."""
+        self._evict(ts)
+        state = self.cards.get(card)
+        if state is None:
+            state = self.cards[card] = _CardState(len(self.windows))
+        else:
+            self.cards.move_to_end(card)
+
+        cents = 0 if amount != amount else round(amount * 100)
+        features = {}
+        for k, (suffix, span) in enumerate(self.windows):
+            events = state.events[k]
+            while events and events[0][0] <= ts - span:
+                state.cents[k] -= events.popleft()[1]
+            features[f"txn_count_{suffix}"] = float(len(events))
+            features[f"amt_sum_{suffix}"] = state.cents[k] / 100
+            events.append((ts, cents))
+            state.cents[k] += cents
+
+        if state.last_ts is None:
+            features["secs_since_last"] = features["dist_from_prev_km"] = NO_HISTORY
+        else:
+            features["secs_since_last"] = float(ts - state.last_ts)
+            features["dist_from_prev_km"] = float(haversine(state.last_lat, state.last_long, lat, long))
+        state.last_ts, state.last_lat, state.last_long = ts, lat, long
+        return features
+
+
+def _seconds(series):
+    """Event times as float seconds (unix numbers pass through, date strings are parsed)."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    stamps = pd.to_datetime(series, errors='coerce')
+    return (stamps - pd.Timestamp(0)).dt.total_seconds().to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _spec_columns(spec):
+    return [spec[k] for k in ("key", "time", "amount", "lat", "long") if spec.get(k)]
+
+
+def backfill(df, spec, windows=VELOCITY_WINDOWS, ttl=VELOCITY_TTL):
+    """
+    Vectorized replay of VelocityStore over a whole frame: the same values,
+    without a Python loop per event. Rows are ordered by (card, time) with
+    file order breaking ties, and each window edge is found with one
+    searchsorted over a (card, time) composite key; sums come from an
+    integer-cent cumulative sum. Returns a float64 frame of velocity_columns
+    indexed like df (rows without card or time get empty history).
+    """
+    n = len(df)
+    cols = velocity_columns(windows)
+    out = {c: np.zeros(n) for c in cols}
+    out["secs_since_last"][:] = out["dist_from_prev_km"][:] = NO_HISTORY
+
+    codes, _ = pd.factorize(df[spec['key']])
+    ts = _seconds(df[spec['time']])
+    rows = np.flatnonzero((codes >= 0) & ~np.isnan(ts))
+    if len(rows):
+        order = rows[np.lexsort((ts[rows], codes[rows]))]  # lexsort is stable
+        t = ts[order]
+        # Card blocks spaced further apart than any window, so no edge crosses cards
+        gap = t.max() - t.min() + max(windows.values()) + 1
+        key = codes[order] * gap + (t - t.min())
+
+        amount = df[spec['amount']].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+        cents = np.rint(np.nan_to_num(amount * 100)).astype(np.int64)
+        csum = np.concatenate([[0], np.cumsum(cents)])
+        pos = np.arange(len(order))
+        for suffix, span in windows.items():
+            left = np.searchsorted(key, key - span, side='right')
+            out[f"txn_count_{suffix}"][order] = pos - left
+            out[f"amt_sum_{suffix}"][order] = (csum[pos] - csum[left]) / 100
+
+        same_card = np.r_[False, codes[order][1:] == codes[order][:-1]]
+        since = np.r_[0.0, np.diff(t)]
+        has_prev = same_card & (since <= ttl)  # longer gaps were evicted from the store
+        out["secs_since_last"][order] = np.where(has_prev, since, NO_HISTORY)
+
+        if spec.get('lat') and spec.get('long'):
+            lat = df[spec['lat']].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+            long = df[spec['long']].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+            dist = haversine(np.r_[np.nan, lat[:-1]], np.r_[np.nan, long[:-1]], lat, long)
+            out["dist_from_prev_km"][order] = np.where(has_prev, dist, NO_HISTORY)
+
+    return pd.DataFrame(out, index=df.index)
+
+
+def add_velocity(df, config):
+    """Adds the velocity features of a domain (config['velocity']) to a frame; unchanged when unavailable."""
+    spec = config.get('velocity')
+    if not spec or not set(_spec_columns(spec)) <= set(df.columns):
+        return df
+    features = backfill(df, spec)
+    return df.assign(**{c: features[c].to_numpy(dtype=np.float32) for c in features.columns})
+
+
+def with_velocity(chunks, config, ttl=VELOCITY_TTL):
+    """
+    Adds velocity features to a stream of chunks, in bounded memory.
+    Rows of the last 24h window, plus each recent card's last row, are
+    carried into the next chunk, so the values match backfill over the
+    whole file as long as the file is in time order (as transaction logs are).
+    """
+    spec = config.get('velocity')
+    carry = None
+    for chunk in chunks:
+        if not spec or not set(_spec_columns(spec)) <= set(chunk.columns):
+            yield chunk
+            continue
+        inputs = chunk[_spec_columns(spec)]
+        frame = inputs if carry is None else pd.concat([carry, inputs])
+        features = backfill(frame, spec, ttl=ttl).iloc[len(frame) - len(chunk):]
+        yield chunk.assign(**{c: features[c].to_numpy(dtype=np.float32) for c in features.columns})
+
+        ts = _seconds(frame[spec['time']])
+        latest = np.nanmax(ts) if len(ts) else np.nan
+        recent = ts > latest - max(VELOCITY_WINDOWS.values())
+        last_seen = ~frame[spec['key']].duplicated(keep='last').to_numpy() & (ts >= latest - ttl)
+        carry = frame[recent | last_seen]
@@ -0,0 +1,21 @@
+# tests/conftest.py
+import os
+import sys
+import pytest
+
+# Tests import the app's modules as `src.*`, like the pages do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def card_model():
+    """A small Credit Card model trained on synthetic rows (with the pipeline's velocity features)."""
+    from benchmarks.synth import synthetic_frame
+    from src.ml_logic import FraudModel
+    from src.schema import DOMAIN_CONFIG
+    from src.velocity import add_velocity
+    config = DOMAIN_CONFIG["Credit Card"]
+    model = FraudModel(add_velocity(synthetic_frame("Credit Card", 5000, fraud_rate=0.05), config), config,
+                       model_type="Hist Gradient Boosting")
+    assert "error" not in model.train()
+    return model
@@ -0,0 +1,46 @@
+# tests/test_backtest.py
+import numpy as np
+import pytest
+from benchmarks.synth import synthetic_frame
+from src import backtest as bt, engine
+from src.ingest import positive_mask
+from src.profiles import customer_key
+from src.rules import SCORE_CAP
+from src.schema import DOMAIN_CONFIG
+from src.storage import load_dataset
+
+DOMAIN = "Credit Card"
+# 19-digit cards 1 apart: float64 steps by 512 up here, so a float spill merges them
+FIRST_CARD = 4_000_000_000_000_000_000
+
+
+@pytest.fixture
+def card_file(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.storage.CACHE_DIR", str(tmp_path / "cache"))
+    df = synthetic_frame(DOMAIN, 4000)
+    df["cc_num"] = FIRST_CARD + (df["cc_num"] - df["cc_num"].min())
+    df.loc[::97, "cc_num"] = None  # a few rows without a card
+    df["cc_num"] = df["cc_num"].astype("Int64")
+    df.to_csv(tmp_path / "cards.csv", index=False)
+
+    # Per-card limits that alternate between never and always firing
+    pairs = df.dropna(subset=["cc_num"])[["cc_num", "category"]].drop_duplicates()
+    context = {"customer_thresholds": {
+        customer_key(card, cat): (0.0 if card % 2 else 1e9) for card, cat in pairs.itertuples(index=False)
+    }}
+    monkeypatch.setattr(engine, "load_context", lambda: context)
+    return str(tmp_path / "cards.csv"), context
+
+
+def test_backtest_matches_analyze_batch_on_long_card_numbers(card_file):
+    path, context = card_file
+    config = DOMAIN_CONFIG[DOMAIN]
+    table = bt.backtest(path, DOMAIN, workers=1, chunk_rows=1000)
+
+    df = load_dataset(path, config)
+    score = engine.AdvancedFraudEngine(context=context).analyze_batch(df, DOMAIN)["score"].to_numpy().astype(int)
+    label = positive_mask(df[config["target"]]).astype(int)
+    histogram = np.zeros((SCORE_CAP + 1, 2), dtype=np.int64)
+    np.add.at(histogram, (score, label), 1)
+
+    assert table.equals(bt.cutoff_table(histogram))
@@ -0,0 +1,55 @@
+# tests/test_hybrid.py
+import copy
+from benchmarks.synth import synthetic_frame
+from src.engine import AdvancedFraudEngine
+from src.hybrid import HybridScorer
+from src.schema import DOMAIN_CONFIG
+from src.velocity import add_velocity
+
+DOMAIN = "Credit Card"
+
+
+def riskiest_clean_record(model, engine):
+    """The record the model scores highest among those no rule flags."""
+    config = DOMAIN_CONFIG[DOMAIN]
+    df = add_velocity(synthetic_frame(DOMAIN, 2000, seed=1, fraud_rate=0.05), config)
+    df = df[engine.analyze_batch(df, DOMAIN)["score"].to_numpy() == 0]
+    probability = model.predict_batch(df)
+    return df.iloc[probability.argmax()].to_dict(), float(probability.max())
+
+
+def test_picked_threshold_changes_the_action(card_model):
+    engine = AdvancedFraudEngine(context={})
+    session_model = copy.copy(card_model)  # what the cache hands each session
+    record, probability = riskiest_clean_record(session_model, engine)
+    assert probability > 0
+    trained = card_model.threshold
+
+    session_model.set_threshold(probability * 1.5)
+    assert HybridScorer(session_model, DOMAIN, engine).score_transaction(record)["action"] == "APPROVE"
+    session_model.set_threshold(probability / 2)
+    assert HybridScorer(session_model, DOMAIN, engine).score_transaction(record)["action"] != "APPROVE"
+
+    assert session_model.block_threshold >= session_model.threshold
+    assert card_model.threshold == trained  # other sessions keep the trained cutoff
+
+
+def test_advice_follows_the_hybrid_action(card_model):
+    engine = AdvancedFraudEngine(context={})
+    model = copy.copy(card_model)
+    model.set_threshold(1.0)  # the model alone never alerts: the rules decide
+    scorer = HybridScorer(model, DOMAIN, engine)
+    record, _ = riskiest_clean_record(model, engine)
+    # Over the grocery limit (200) and a card burst (5 an hour): review on the rules alone
+    record.update(category="grocery", amt=250.0, txn_count_1h=6.0)
+
+    result = scorer.score_transaction(record)
+    assert result["action"] == "MANUAL REVIEW"
+    advice = scorer.advice(record, result)
+    assert advice != ["Transaction looks safe."]
+
+    # Only changes the whole pipeline approves are suggested, cheapest first
+    options = scorer.counterfactuals(record)
+    assert options[0]["changes"] == {"amt": 175.0}  # back under the grocery limit; the burst alone scores 25
+    for option in options:
+        assert scorer.score_transaction({**record, **option["changes"]})["action"] == "APPROVE"
@@ -0,0 +1,27 @@
+# tests/test_preprocessing.py
+import numpy as np
+import pytest
+from benchmarks.synth import synthetic_frame
+from src.preprocessing import DomainTransformer
+from src.schema import DOMAIN_CONFIG
+
+
+@pytest.mark.parametrize("unknown_as_nan", [True, False])
+@pytest.mark.parametrize("domain", list(DOMAIN_CONFIG))
+def test_single_row_matches_batch(domain, unknown_as_nan):
+    config = DOMAIN_CONFIG[domain]
+    df = synthetic_frame(domain, 500)
+    transformer = DomainTransformer(config, unknown_as_nan=unknown_as_nan).fit(df)
+
+    rows = df.head(20).copy()
+    cats = [c for c in transformer.feature_cols if c in transformer.categories]
+    nums = [c for c in transformer.feature_cols if c not in transformer.categories]
+    if cats:
+        rows.loc[rows.index[0], cats[0]] = "never seen"
+        rows.loc[rows.index[1], cats[0]] = None
+    if nums:
+        rows.loc[rows.index[2], nums[0]] = np.nan
+
+    batch = transformer.transform(rows)
+    single = np.vstack([transformer.transform(r) for r in rows.to_dict('records')])
+    np.testing.assert_array_equal(single, batch)
@@ -0,0 +1,35 @@
+# tests/test_profiles.py
+import numpy as np
+import pandas as pd
+from src.engine import AdvancedFraudEngine
+from src.ingest import iter_chunks
+from src.profiles import customer_key
+from src.schema import DOMAIN_CONFIG
+
+CARDS = [4000000000000000123, 4000000000000000124]  # differ only past float64's 53 bits
+
+
+def test_customer_key_uses_exact_digits():
+    assert customer_key(CARDS[0], "grocery") == "4000000000000000123|grocery"
+    assert customer_key(np.int64(CARDS[0]), "grocery") == "4000000000000000123|grocery"
+    assert customer_key(42.0, "grocery") == "42|grocery"
+    # A float that large is already rounded: it must not pass for either card
+    assert customer_key(float(CARDS[0]), "grocery") not in {customer_key(c, "grocery") for c in CARDS}
+
+
+def test_card_thresholds_match_long_card_numbers(tmp_path):
+    (tmp_path / "cards.csv").write_text(
+        "cc_num,category,amt,is_fraud\n"
+        f"{CARDS[0]},grocery,400,0\n"
+        ",grocery,400,0\n"
+        f"{CARDS[1]},grocery,400,0\n"
+    )
+    df = pd.concat(iter_chunks(str(tmp_path / "cards.csv"), DOMAIN_CONFIG["Credit Card"]))
+    assert df["cc_num"].tolist()[::2] == CARDS
+
+    # Only the first card's own limit lets $400 of groceries through
+    engine = AdvancedFraudEngine(context={"customer_thresholds": {customer_key(CARDS[0], "grocery"): 1000.0}})
+    batch = engine.analyze_batch(df, "Credit Card")["score"].tolist()
+    single = [engine.analyze_transaction(r, "Credit Card")["score"] for r in df.to_dict("records")]
+    assert batch == single
+    assert batch[0] == 0 and batch[2] > 0
@@ -0,0 +1,31 @@
+# tests/test_service.py
+import pytest
+from benchmarks.synth import synthetic_frame
+from src.engine import AdvancedFraudEngine
+from src.service import ScoringService
+
+DOMAIN = "Credit Card"
+RESULT_KEYS = {"probability", "rule_score", "factors", "risk_score", "action"}
+
+
+@pytest.fixture
+def service(card_model):
+    return ScoringService(card_model, DOMAIN, engine=AdvancedFraudEngine(context={}))
+
+
+def test_empty_record_scores_like_a_record_without_fields(service):
+    (empty,) = service.score_records([{}])
+    assert set(empty) == RESULT_KEYS
+    assert service.score_records([{"unrelated": 1}]) == [empty]
+    assert service.score_records([{}, {"amt": "lots"}, {}]) == [empty, {"error": "field 'amt': expected a number, got 'lots'"}, empty]
+
+
+def test_mixed_batch_keeps_every_slot(service):
+    good = synthetic_frame(DOMAIN, 1).to_dict("records")[0]
+    results = service.score_records([good, {}, {"amt": "lots"}, {"unrelated": 1}])
+
+    assert len(results) == 4
+    assert set(results[0]) == RESULT_KEYS and set(results[1]) == RESULT_KEYS and set(results[3]) == RESULT_KEYS
+    assert results[2] == {"error": "field 'amt': expected a number, got 'lots'"}
+    # Only the record with the velocity columns reached the per-card state
+    assert len(service.velocity) == 1
@@ -0,0 +1,64 @@
+# tests/test_storage.py
+import numpy as np
+import pandas as pd
+import pytest
+from src import storage
+from src.ingest import domain_columns
+from src.schema import DOMAIN_CONFIG
+from src.validators import schema_renames
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+def mobile_csv(path, rows=200):
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        "step": np.arange(rows) // 10 + 1,
+        "type": rng.choice(["PAYMENT", "TRANSFER", "CASH_OUT"], rows),
+        "amount": rng.random(rows) * 1000,
+        "nameOrig": [f"C{i}" for i in rng.integers(0, 50, rows)],
+        "oldbalanceOrg": rng.random(rows) * 5000,
+        "newbalanceOrig": rng.random(rows) * 5000,
+        "nameDest": [f"M{i}" for i in rng.integers(0, 50, rows)],
+        "oldbalanceDest": rng.random(rows) * 5000,
+        "newbalanceDest": rng.random(rows) * 5000,
+        "isFraud": (rng.random(rows) < 0.1).astype(int),
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.skipif(storage.pq is None, reason="needs pyarrow")
+def test_same_file_loads_under_two_domains(tmp_path, cache_dir):
+    path = mobile_csv(tmp_path / "upload.csv")
+    as_card = storage.load_dataset(path, DOMAIN_CONFIG["Credit Card"])
+    as_mobile = storage.load_dataset(path, DOMAIN_CONFIG["Mobile Transaction"])
+
+    assert "amt" in as_card.columns  # 'amount' read as the card domain's amount
+    assert "amount" in as_mobile.columns and "amt" not in as_mobile.columns
+    assert len(list(cache_dir.glob("*.parquet"))) == 2
+
+
+
+@pytest.mark.skipif(storage.pq is None, reason="needs pyarrow")
+def test_parquet_copy_holds_only_domain_columns(tmp_path, cache_dir):
+    path = mobile_csv(tmp_path / "upload.csv")
+    df = pd.read_csv(path)
+    df["notes"] = "free text the domain never reads"
+    df.to_csv(path, index=False)
+
+    storage.load_dataset(path, DOMAIN_CONFIG["Mobile Transaction"])
+    (cached,) = cache_dir.glob("*.parquet")
+    assert "notes" not in storage.pq.read_schema(cached).names
+    assert "amount" in storage.pq.read_schema(cached).names
+
+
+def test_renames_come_from_the_domain_validator_only():
+    header = ["amount", "location", "is_fraud"]
+    card = DOMAIN_CONFIG["Credit Card"]
+    assert schema_renames(header, domain_columns(card), "Credit Card") == {"amount": "amt"}  # 'location' isn't a category
+    assert schema_renames(header, domain_columns(card), "Mobile Transaction") == {}
+    assert schema_renames(header, domain_columns(card), None) == {}